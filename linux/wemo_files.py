@@ -0,0 +1,121 @@
+"""Shared file helpers: crash-safe JSON saves, and watching the data directory for saves made by another process."""
+import os
+import sys
+import json
+import shutil
+import time
+import select
+import struct
+
+# --- SAFE PERSISTENCE ---
+def write_json_atomic(path, data, **dump_args):
+    """Temp file + fsync + rename, so a crash never leaves a truncated file. The previous version is kept as <path>.bak."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(data, f, **dump_args)
+        f.flush()
+        os.fsync(f.fileno())
+    if os.path.exists(path):
+        bak = path + ".bak"
+        try:
+            if os.path.exists(bak): os.remove(bak)
+            os.link(path, bak)  # hard link: no extra data written
+        except OSError:
+            try: shutil.copy2(path, bak)
+            except: pass
+    os.replace(tmp, path)
+    if os.name != 'nt':
+        try:
+            fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+            try: os.fsync(fd)
+            finally: os.close(fd)
+        except: pass
+
+def load_json(path, default_type=dict):
+    """Reads path, falling back to the .bak copy if it's missing or corrupt; default_type() if neither is usable."""
+    for p in (path, path + ".bak"):
+        if os.path.exists(p):
+            try:
+                with open(p) as f:
+                    data = json.load(f)
+                    if isinstance(data, default_type): return data
+            except: pass
+    return default_type()
+
+# --- CONFIG WATCHER ---
+class ConfigWatcher:
+    """Blocks until one of the named files in a directory is rewritten or replaced.
+    Uses inotify on the directory on Linux (saves are atomic renames); elsewhere compares stat() snapshots."""
+    IN_MODIFY = 0x2
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self, directory, names, poll_interval=2):
+        self.directory = directory
+        self.names = set(names)
+        self.poll_interval = poll_interval
+        self.fd = None
+        if sys.platform.startswith("linux"):
+            try:
+                import ctypes, ctypes.util
+                libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+                fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+                mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+                if fd >= 0 and libc.inotify_add_watch(fd, os.fsencode(directory), mask) >= 0: self.fd = fd
+                elif fd >= 0: os.close(fd)
+            except:
+                self.fd = None
+        self.last_snapshot = self._snapshot()
+
+    def _snapshot(self):
+        snap = {}
+        for name in self.names:
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+                snap[name] = (st.st_mtime_ns, st.st_size, st.st_ino)
+            except OSError:
+                snap[name] = None
+        return snap
+
+    def _read_events(self):
+        changed = set()
+        try:
+            buf = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return changed
+        pos = 0
+        while pos + self.EVENT.size <= len(buf):
+            _, _, _, length = self.EVENT.unpack_from(buf, pos)
+            name = buf[pos + self.EVENT.size:pos + self.EVENT.size + length].rstrip(b"\0").decode(errors="ignore")
+            if name in self.names: changed.add(name)
+            pos += self.EVENT.size + length
+        return changed
+
+    def wait_for_change(self, timeout):
+        """Returns the set of watched names that changed within timeout seconds (empty if none)."""
+        deadline = time.time() + timeout
+        if self.fd is not None:
+            try:
+                while True:
+                    remaining = deadline - time.time()
+                    if remaining <= 0: return set()
+                    if not select.select([self.fd], [], [], remaining)[0]: return set()
+                    changed = self._read_events()
+                    if changed:
+                        # A save is a burst of events (temp write, rename); let it settle and react once
+                        time.sleep(0.1)
+                        return changed | self._read_events()
+            except OSError:
+                self.fd = None
+
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0: return set()
+            time.sleep(min(self.poll_interval, remaining))
+            snap = self._snapshot()
+            if snap != self.last_snapshot:
+                changed = {n for n in self.names if snap.get(n) != self.last_snapshot.get(n)}
+                self.last_snapshot = snap
+                return changed
@@ -13,6 +13,7 @@ import subprocess
 import concurrent.futures
 from tkinter import messagebox
 import pyperclip
+from wemo_files import write_json_atomic, load_json
 
 # --- CONFIGURATION ---
 VERSION = "v4.1 (Linux Subnet Edition)"
@@ -178,8 +179,8 @@ class WemoOpsApp(ctk.CTk):
         self.current_setup_ip = None 
         self.current_setup_port = None 
         
-        self.profiles = self.load_json(PROFILE_FILE, dict)
-        self.settings = self.load_json(SETTINGS_FILE, dict)
+        self.profiles = load_json(PROFILE_FILE, dict)
+        self.settings = load_json(SETTINGS_FILE, dict)
 
         self.schedules = []
         try:
@@ -695,17 +696,8 @@ class WemoOpsApp(ctk.CTk):
     # ---------------------------------------------------------
     # UTILITY METHODS
     # ---------------------------------------------------------
-    def load_json(self, path, default_type=dict):
-        if os.path.exists(path):
-            try:
-                with open(path) as f: 
-                    data = json.load(f)
-                    if isinstance(data, default_type): return data
-            except: pass
-        return default_type()
-
     def save_json(self, path, data):
-        with open(path, 'w') as f: json.dump(data, f)
+        write_json_atomic(path, data)
 
     def save_current_profile(self):
         ssid = self.ssid_entry.get()
@@ -1,11 +1,10 @@
 import pywemo
-import time
-import json
 import os
 import datetime
 import requests
 import sys
 import fcntl  # Standard Unix file locking
+from wemo_files import write_json_atomic, load_json, ConfigWatcher
 
 # --- CONFIGURATION ---
 VERSION = "v4.0-Linux-Service"
@@ -22,18 +21,8 @@ SCHEDULE_FILE = os.path.join(APP_DATA_DIR, "schedules.json")
 SETTINGS_FILE = os.path.join(APP_DATA_DIR, "settings.json")
 LOCK_FILE_PATH = os.path.join(APP_DATA_DIR, LOCK_FILE_NAME)
 
-def load_json(path, default_type=dict):
-    if os.path.exists(path):
-        try:
-            with open(path) as f:
-                data = json.load(f)
-                if isinstance(data, default_type): return data
-        except: pass
-    return default_type()
-
 def save_json(path, data):
-    try:
-        with open(path, 'w') as f: json.dump(data, f)
+    try: write_json_atomic(path, data)
     except: pass
 
 class SolarEngine:
@@ -96,9 +85,13 @@ def run_service():
         for d in devices: known_devices[d.name] = d
     except: pass
 
+    # Reload config only when it actually changes on disk (inotify), not on every pass
+    watcher = ConfigWatcher(APP_DATA_DIR, [os.path.basename(SCHEDULE_FILE), os.path.basename(SETTINGS_FILE)])
+    schedules = load_json(SCHEDULE_FILE, list)
+
     while True:
         try:
-            schedules = load_json(SCHEDULE_FILE, list)
+            schedule_updated = False
             now = datetime.datetime.now()
             today_str = now.strftime("%Y-%m-%d")
             weekday = now.weekday()
@@ -133,10 +126,13 @@ def run_service():
                             elif job['action'] == "Turn OFF": dev.off()
                             elif job['action'] == "Toggle": dev.toggle()
                             job['last_run'] = today_str
-                            save_json(SCHEDULE_FILE, schedules)
+                            schedule_updated = True
                         except: pass
+            if schedule_updated: save_json(SCHEDULE_FILE, schedules)
         except: pass
-        time.sleep(30)
+        changed = watcher.wait_for_change(30)
+        if os.path.basename(SCHEDULE_FILE) in changed: schedules = load_json(SCHEDULE_FILE, list)
+        if os.path.basename(SETTINGS_FILE) in changed: solar = SolarEngine()
 
 if __name__ == "__main__":
     run_service()
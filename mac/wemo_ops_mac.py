@@ -4,12 +4,12 @@ import threading
 import sys
 import os
 import time
-import json
 import requests
 import datetime
 import subprocess
 from tkinter import messagebox
 import pyperclip
+from wemo_files import write_json_atomic, load_json
 
 # --- CONFIGURATION ---
 VERSION = "v4.0 (Mac)"
@@ -104,12 +104,12 @@ class WemoOpsApp(ctk.CTk):
         self.current_setup_ip = None 
         
         # --- ROBUST DATA LOADING ---
-        self.profiles = self.load_json(PROFILE_FILE, dict)
-        self.settings = self.load_json(SETTINGS_FILE, dict)
+        self.profiles = load_json(PROFILE_FILE, dict)
+        self.settings = load_json(SETTINGS_FILE, dict)
 
         self.schedules = []
         try:
-            raw_sched = self.load_json(SCHEDULE_FILE, list)
+            raw_sched = load_json(SCHEDULE_FILE, list)
             if isinstance(raw_sched, list):
                 self.schedules = raw_sched
             else:
@@ -529,17 +529,8 @@ class WemoOpsApp(ctk.CTk):
     # ---------------------------------------------------------
     # UTILITY METHODS
     # ---------------------------------------------------------
-    def load_json(self, path, default_type=dict):
-        if os.path.exists(path):
-            try:
-                with open(path) as f: 
-                    data = json.load(f)
-                    if isinstance(data, default_type): return data
-            except: pass
-        return default_type()
-
     def save_json(self, path, data):
-        with open(path, 'w') as f: json.dump(data, f)
+        write_json_atomic(path, data)
 
     def save_current_profile(self):
         ssid = self.ssid_entry.get()
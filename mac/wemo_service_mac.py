@@ -1,11 +1,11 @@
 import pywemo
 import time
-import json
 import os
 import datetime
 import requests
 import sys
 import fcntl  # macOS file locking
+from wemo_files import write_json_atomic, load_json
 
 # --- CONFIGURATION ---
 VERSION = "v4.0-Mac-Service"
@@ -23,18 +23,8 @@ SETTINGS_FILE = os.path.join(APP_DATA_DIR, "settings.json")
 LOCK_FILE_PATH = os.path.join(APP_DATA_DIR, LOCK_FILE_NAME)
 
 # --- UTILS ---
-def load_json(path, default_type=dict):
-    if os.path.exists(path):
-        try:
-            with open(path) as f:
-                data = json.load(f)
-                if isinstance(data, default_type): return data
-        except: pass
-    return default_type()
-
 def save_json(path, data):
-    try:
-        with open(path, 'w') as f: json.dump(data, f)
+    try: write_json_atomic(path, data)
     except: pass
 
 class SolarEngine:
@@ -111,6 +101,7 @@ def run_service():
     while True:
         try:
             schedules = load_json(SCHEDULE_FILE, list)
+            schedule_updated = False
             now = datetime.datetime.now()
             today_str = now.strftime("%Y-%m-%d")
             weekday = now.weekday()
@@ -148,8 +139,9 @@ def run_service():
                             elif job['action'] == "Toggle": dev.toggle()
                             
                             job['last_run'] = today_str
-                            save_json(SCHEDULE_FILE, schedules)
+                            schedule_updated = True
                         except: pass
+            if schedule_updated: save_json(SCHEDULE_FILE, schedules)
         except: pass
         
         time.sleep(30)
@@ -52,7 +52,7 @@ source .venv/bin/activate
 # Install dependencies
 echo "   > Installing Python libraries..."
 pip install --upgrade pip --quiet
-pip install "pywemo>=2.1.1" customtkinter requests pyinstaller pyperclip Pillow flask qrcode waitress --quiet
+pip install "pywemo==2.1.2" customtkinter requests pyinstaller pyperclip Pillow flask qrcode waitress --quiet
 
 # Clean previous builds
 rm -rf build/ dist/
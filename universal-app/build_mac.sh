@@ -32,7 +32,7 @@ source ".venv_mac/bin/activate"
 
 echo "   > Installing Libraries..."
 pip install --upgrade pip --quiet
-pip install "pywemo>=2.1.1" customtkinter requests pyinstaller pyperclip Pillow flask qrcode waitress --quiet
+pip install "pywemo==2.1.2" customtkinter requests pyinstaller pyperclip Pillow flask qrcode waitress --quiet
 
 # 3. CLEANUP
 rm -rf build/ dist/
@@ -65,7 +65,7 @@ source .venv/bin/activate
 echo "   > Installing Python libraries..."
 pip install --upgrade pip --quiet
 # Force binary preference to avoid compilation issues on Linux
-pip install "pywemo>=2.1.1" customtkinter requests pyinstaller pyperclip Pillow flask qrcode waitress --quiet --prefer-binary
+pip install "pywemo==2.1.2" customtkinter requests pyinstaller pyperclip Pillow flask qrcode waitress --quiet --prefer-binary
 
 rm -rf dist/rpm_build
 rm -f dist/*.rpm
@@ -40,7 +40,7 @@ call .venv\Scripts\activate.bat
 :: Use python -m to avoid Windows file locking errors
 python -m pip install --upgrade pip
 :: Added Flask (Server), QRCode (Mobile), and Waitress (Production WSGI)
-pip install "pywemo>=2.1.1" customtkinter requests pyinstaller pyperclip pystray Pillow flask qrcode waitress
+pip install "pywemo==2.1.2" customtkinter requests pyinstaller pyperclip pystray Pillow flask qrcode waitress
 
 :: 4. BUILD EXECUTABLES
 echo [3/5] Compiling Binaries...
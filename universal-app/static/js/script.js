@@ -58,16 +58,16 @@ async function updateDashboard() {
       data
         .sort((a, b) => a.name.localeCompare(b.name))
         .forEach((d) => {
-          sel.add(new Option(d.name, d.name));
+          sel.add(new Option(d.name, d.id));
           let div = document.createElement("div");
           div.className = "card flex";
-          div.id = "card-" + d.name.replace(/\s+/g, "-");
+          div.id = "card-" + d.id.replace(/\W+/g, "-");
           div.innerHTML = `
                             <div>
                                 <div style="font-weight:bold; font-size:1.1rem;">${d.name}</div>
                                 <div style="font-size:0.8rem; color:var(--subtext);">${d.ip}</div>
                             </div>
-                            <button id="btn-${d.name.replace(/\s+/g, "-")}" class="btn btn-toggle ${d.state ? "on" : ""}" onclick="toggle('${d.name}')">
+                            <button id="btn-${d.id.replace(/\W+/g, "-")}" class="btn btn-toggle ${d.state ? "on" : ""}" onclick="toggle('${d.id}')">
                                 ${d.state ? "ON" : "OFF"}
                             </button>`;
           list.appendChild(div);
@@ -75,7 +75,7 @@ async function updateDashboard() {
     } else {
       data.forEach((d) => {
         const btn = document.getElementById(
-          "btn-" + d.name.replace(/\s+/g, "-"),
+          "btn-" + d.id.replace(/\W+/g, "-"),
         );
         if (btn) {
           const isOn = d.state === 1 || d.state === true;
@@ -92,14 +92,14 @@ async function updateDashboard() {
   }
 }
 
-async function toggle(n) {
-  const btn = document.getElementById("btn-" + n.replace(/\s+/g, "-"));
+async function toggle(id) {
+  const btn = document.getElementById("btn-" + id.replace(/\W+/g, "-"));
   if (btn) {
     const isNowOn = btn.innerText === "OFF";
     btn.className = `btn btn-toggle ${isNowOn ? "on" : ""}`;
     btn.innerText = isNowOn ? "ON" : "OFF";
   }
-  await API.post("toggle/" + n);
+  await API.post("toggle/" + encodeURIComponent(id));
   setTimeout(updateDashboard, 500);
 }
 
@@ -131,8 +131,10 @@ async function updateSchedules() {
 }
 
 async function addSchedule() {
+  const sel = document.getElementById("s-dev");
   await API.post("schedules", {
-    device: document.getElementById("s-dev").value,
+    device_id: sel.value,
+    device: sel.selectedIndex >= 0 ? sel.options[sel.selectedIndex].text : "",
     action: document.getElementById("s-action").value,
     type: document.getElementById("s-type").value,
     value: document.getElementById("s-val").value,
@@ -210,10 +212,18 @@ function triggerScan() {
   alert("Scanning Network...");
 }
 
+function formatScanStatus(s) {
+  const p = s.scan_progress || {};
+  if (s.scan_status === "Idle" || !p.phase) return s.scan_status;
+  if (p.phase === "deep" && p.hosts_total)
+    return `${s.scan_status} ${p.hosts_probed}/${p.hosts_total} probed, ${p.hosts_open} open, ${p.verified} verified`;
+  return `${s.scan_status} ${p.devices_found || 0} found`;
+}
+
 // --- POLLING LOOP ---
 async function poller() {
   const s = await API.get("status");
-  document.getElementById("scan-status").innerText = s.scan_status;
+  document.getElementById("scan-status").innerText = formatScanStatus(s);
 
   await updateDashboard();
   await updateSchedules();
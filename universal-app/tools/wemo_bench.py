@@ -0,0 +1,239 @@
+"""Benchmarks for Wemo Ops Server hot paths.
+
+    python tools/wemo_bench.py                                  # all benchmarks, default sizes
+    python tools/wemo_bench.py scan poll --devices 200
+    python tools/wemo_bench.py --out bench/v5.2.4.json --compare bench/v5.2.3.json
+
+Devices come from tools/wemo_simulator.py, never real plugs, and the server
+module runs against a throwaway WEMO_DATA_DIR.
+
+    scan      DeepScanner sweep of one simulated /24 (seconds per /24, hosts/s)
+    poll      poll_cycle() over N simulated devices (cycle time)
+    schedule  evaluate_rules() over 10k rules, plus loading them from the store
+    api       GET /api/devices through waitress with C concurrent clients
+
+Results are written as JSON. Each benchmark has a "headline" block of numbers;
+--compare prints their change against an earlier results file, and --fail-over
+makes a slowdown beyond that percentage exit non-zero (for CI).
+"""
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import platform
+import argparse
+import datetime
+import threading
+import subprocess
+import http.client
+import concurrent.futures
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+os.environ.setdefault("WEMO_DATA_DIR", tempfile.mkdtemp(prefix="wemo-bench-"))
+
+import logging
+from wemo_simulator import Fleet
+import wemo_server as srv
+
+logging.getLogger("WemoServer").setLevel(logging.WARNING)
+logging.getLogger("pywemo").setLevel(logging.CRITICAL)
+logging.getLogger("waitress").setLevel(logging.ERROR)
+
+
+def summarize(samples):
+    """min/mean/percentiles of a list of seconds."""
+    if not samples: return {}
+    s = sorted(samples)
+    pick = lambda q: s[min(len(s) - 1, int(q * len(s)))]
+    return {"n": len(s), "min": s[0], "mean": sum(s) / len(s), "p50": pick(0.5),
+            "p95": pick(0.95), "p99": pick(0.99), "max": s[-1]}
+
+
+def clear_registry():
+    srv.device_registry.prune(lambda e: True)
+
+
+# --- BENCHMARKS ---
+def bench_scan(args):
+    count = min(args.devices, 254)
+    with Fleet(count, subnet=args.subnet, latency=args.latency, jitter=args.jitter, seed=args.seed):
+        ds = srv.DeepScanner()
+        hosts = ds.expand_hosts([args.subnet])
+        times, found = [], []
+        for _ in range(args.rounds):
+            progress = {}
+            t0 = time.perf_counter()
+            found.append(len(list(ds.iter_hosts(hosts, progress))))
+            times.append(time.perf_counter() - t0)
+    t = summarize(times)
+    return {"hosts": len(hosts), "devices": count, "found_min": min(found), "seconds": t,
+            "headline": {"seconds_per_24": t["p50"], "hosts_per_sec": len(hosts) / t["p50"]}}
+
+
+def bench_poll(args):
+    import pywemo
+    with Fleet(args.devices, base_port=args.base_port, latency=args.latency, jitter=args.jitter, seed=args.seed) as fleet:
+        urls = [f"http://{d.host}:{d.port}/setup.xml" for d in fleet.devices]
+        t0 = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(32) as pool:
+            for dev in pool.map(pywemo.discovery.device_from_description, urls):
+                if dev: srv.register_device(dev)
+        setup = time.perf_counter() - t0
+        times = []
+        for _ in range(args.rounds):
+            t0 = time.perf_counter()
+            srv.poll_cycle()
+            times.append(time.perf_counter() - t0)
+        polled = len(srv.device_registry)
+        clear_registry()
+    t = summarize(times)
+    return {"devices": polled, "setup_seconds": setup, "cycle_seconds": t,
+            "headline": {"cycle_seconds": t["p50"], "devices_per_sec": polled / t["p50"]}}
+
+
+def bench_schedule(args):
+    rng = random.Random(args.seed)
+    kinds = ("Time (Fixed)", "Time (Fixed)", "Sunrise", "Sunset")
+    with srv.store.transaction() as db:
+        db.execute("DELETE FROM schedules")
+    t0 = time.perf_counter()
+    for i in range(args.rules):
+        kind = rng.choice(kinds)
+        value = f"{rng.randrange(24):02d}:{rng.randrange(60):02d}" if kind == "Time (Fixed)" else str(rng.randrange(0, 90))
+        srv.store.add_schedule({"id": i + 1, "device": f"Plug {i % 200}", "action": rng.choice(("Turn ON", "Turn OFF", "Toggle")),
+                                "type": kind, "value": value, "offset_dir": rng.choice((1, -1)),
+                                "days": sorted(rng.sample(range(7), rng.randint(1, 7))), "last_run": ""})
+    insert = time.perf_counter() - t0
+    solar = {"sunrise": "06:45", "sunset": "18:30"}
+    now = datetime.datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+    load, evaluate, due = [], [], 0
+    for _ in range(args.rounds):
+        t0 = time.perf_counter()
+        jobs = srv.store.list_schedules()
+        t1 = time.perf_counter()
+        d, _ = srv.evaluate_rules(jobs, now, solar, 60)
+        t2 = time.perf_counter()
+        load.append(t1 - t0); evaluate.append(t2 - t1); due = len(d)
+    le, ev = summarize(load), summarize(evaluate)
+    return {"rules": args.rules, "due_at_noon": due, "insert_seconds": insert, "load_seconds": le, "evaluate_seconds": ev,
+            "headline": {"tick_seconds": le["p50"] + ev["p50"], "rules_per_sec": args.rules / ev["p50"]}}
+
+
+def bench_api(args):
+    from waitress import create_server
+    for i in range(args.devices):
+        srv.device_registry.upsert(f"94103E{i:06X}", {"obj": None, "name": f"Plug {i:03d}", "ip": f"10.1.{i // 250}.{i % 250 + 1}",
+                                                     "mac": f"94103E{i:06X}", "serial": str(i), "state": i % 2, "last_seen": time.time()})
+    server = create_server(srv.app, host="127.0.0.1", port=0, threads=args.threads)
+    stop = threading.Event()
+
+    def serve():
+        # server.run() only returns on a signal, and closing the server under its select() from
+        # another thread prints EBADF tracebacks; run the same loop until told to stop, then close
+        # here, after the workers (which pull the loop's trigger when they finish) have exited
+        while not stop.is_set():
+            server.asyncore.loop(timeout=server.adj.asyncore_loop_timeout, map=server._map, count=1)
+        server.task_dispatcher.shutdown()
+        server.asyncore.close_all(server._map)
+
+    serving = threading.Thread(target=serve, daemon=True)
+    serving.start()
+    port = server.effective_port
+
+    def client(n):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        out = []
+        for _ in range(n):
+            t0 = time.perf_counter()
+            conn.request("GET", "/api/devices")
+            conn.getresponse().read()
+            out.append(time.perf_counter() - t0)
+        conn.close()
+        return out
+
+    client(20)  # warm up
+    t0 = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(args.clients) as pool:
+        latencies = [x for r in pool.map(client, [args.requests] * args.clients) for x in r]
+    wall = time.perf_counter() - t0
+    stop.set()
+    server.pull_trigger()
+    serving.join()
+    clear_registry()
+    t = summarize(latencies)
+    return {"devices": args.devices, "clients": args.clients, "server_threads": args.threads, "latency_seconds": t,
+            "headline": {"latency_p50": t["p50"], "latency_p95": t["p95"], "requests_per_sec": len(latencies) / wall}}
+
+
+BENCHMARKS = {"scan": bench_scan, "poll": bench_poll, "schedule": bench_schedule, "api": bench_api}
+
+
+# --- REPORTING ---
+def git_revision():
+    try: return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True).stdout.strip() or None
+    except Exception: return None
+
+
+def compare(results, baseline_path, fail_over):
+    """Prints headline deltas; returns True if any got worse by more than fail_over percent."""
+    with open(baseline_path) as f: baseline = json.load(f)
+    print(f"\nvs {baseline_path} ({baseline['meta'].get('version')} @ {baseline['meta'].get('git')})")
+    regressed = False
+    for name, result in results["benchmarks"].items():
+        old = baseline.get("benchmarks", {}).get(name, {}).get("headline", {})
+        for key, value in result["headline"].items():
+            if not old.get(key): continue
+            change = (value - old[key]) / old[key] * 100
+            # Rates are better higher, everything else (seconds) better lower
+            worse = -change if key.endswith("_per_sec") else change
+            flag = " REGRESSION" if fail_over is not None and worse > fail_over else ""
+            regressed = regressed or bool(flag)
+            print(f"  {name:9s} {key:18s} {old[key]:12.6g} -> {value:12.6g}  {change:+7.1f}%{flag}")
+    return regressed
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark Wemo Ops Server hot paths against simulated devices.")
+    ap.add_argument("benchmarks", nargs="*", metavar="BENCHMARK", help=f"any of {', '.join(BENCHMARKS)} (default: all)")
+    ap.add_argument("--devices", type=int, default=100)
+    ap.add_argument("--rules", type=int, default=10000)
+    ap.add_argument("--clients", type=int, default=8)
+    ap.add_argument("--requests", type=int, default=200, help="per client")
+    ap.add_argument("--threads", type=int, default=6, help="waitress threads (the server uses 6)")
+    ap.add_argument("--rounds", type=int, default=5)
+    ap.add_argument("--subnet", default="127.0.1.0/24")
+    ap.add_argument("--base-port", type=int, default=51000)
+    ap.add_argument("--latency", type=float, default=0.0, help="simulated device latency (s)")
+    ap.add_argument("--jitter", type=float, default=0.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", help="results file (default: wemo_bench_<timestamp>.json)")
+    ap.add_argument("--compare", help="earlier results file to compare against")
+    ap.add_argument("--fail-over", type=float, help="exit 1 if any headline is this many percent worse")
+    args = ap.parse_args()
+
+    names = args.benchmarks or list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown: ap.error(f"unknown benchmark: {', '.join(unknown)}")
+    results = {"meta": {"version": srv.VERSION, "git": git_revision(), "python": platform.python_version(),
+                        "platform": platform.platform(), "cpus": os.cpu_count(),
+                        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                        "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "benchmarks")}},
+               "benchmarks": {}}
+    for name in names:
+        print(f"{name}...", end=" ", flush=True)
+        results["benchmarks"][name] = result = BENCHMARKS[name](args)
+        print(", ".join(f"{k}={v:.6g}" for k, v in result["headline"].items()))
+
+    out = args.out or f"wemo_bench_{datetime.datetime.now():%Y%m%d-%H%M%S}.json"
+    if os.path.dirname(out): os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w") as f: json.dump(results, f, indent=2)
+    print(f"Results: {out}")
+    if args.compare and compare(results, args.compare, args.fail_over): sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""Fake Wemo fleet for load-testing Wemo Ops Server.
+
+Brings up N simulated Wemo Mini plugs, each with its own HTTP server serving
+setup.xml and the basicevent SOAP service (GetBinaryState, SetBinaryState,
+GetFriendlyName, ChangeFriendlyName, GetHKSetupInfo, ReSetup), close enough
+to the real thing that pywemo.discovery.device_from_description() accepts them.
+
+Devices live on loopback aliases (one IP per device, the real port 49153) so
+DeepScanner can sweep them like a real /24, or on distinct ports of one IP:
+
+    python tools/wemo_simulator.py --count 200 --subnet 127.0.1.0/24
+    python tools/wemo_simulator.py --count 50 --host 127.0.0.1 --base-port 50000
+
+Linux routes all of 127.0.0.0/8 to lo; macOS needs `ifconfig lo0 alias <ip>` per address.
+
+Network misbehaviour is configurable and seeded, so runs are repeatable:
+    --latency/--jitter  seconds added to every response
+    --loss              probability a request gets no reply (stalls --stall seconds, then drops)
+    --flaky             probability a SOAP call returns a UPnP fault (HTTP 500)
+
+Standalone only; not part of the Docker image.
+"""
+import re
+import sys
+import json
+import time
+import random
+import signal
+import argparse
+import threading
+import ipaddress
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+BELKIN_OUI = "94103E"
+BASICEVENT = "urn:Belkin:service:basicevent:1"
+
+SETUP_XML = """<?xml version="1.0"?>
+<root xmlns="urn:Belkin:device-1-0">
+  <specVersion><major>1</major><minor>0</minor></specVersion>
+  <device>
+    <deviceType>urn:Belkin:device:controllee:1</deviceType>
+    <friendlyName>{name}</friendlyName>
+    <manufacturer>Belkin International Inc.</manufacturer>
+    <manufacturerURL>http://www.belkin.com</manufacturerURL>
+    <modelDescription>Belkin Plugin Socket 1.0</modelDescription>
+    <modelName>Socket</modelName>
+    <modelNumber>1.0</modelNumber>
+    <serialNumber>{serial}</serialNumber>
+    <UDN>{udn}</UDN>
+    <macAddress>{mac}</macAddress>
+    <firmwareVersion>WeMo_WW_2.00.11452.PVT-OWRT-SNSV2</firmwareVersion>
+    <binaryState>{state}</binaryState>
+    <serviceList>
+      <service>
+        <serviceType>{service}</serviceType>
+        <serviceId>urn:Belkin:serviceId:basicevent1</serviceId>
+        <controlURL>/upnp/control/basicevent1</controlURL>
+        <eventSubURL>/upnp/event/basicevent1</eventSubURL>
+        <SCPDURL>/eventservice.xml</SCPDURL>
+      </service>
+    </serviceList>
+    <presentationURL>/pluginpres.html</presentationURL>
+  </device>
+</root>
+"""
+
+# action -> (in args, out args)
+ACTIONS = {
+    "GetBinaryState": ((), ("BinaryState",)),
+    "SetBinaryState": (("BinaryState",), ("BinaryState",)),
+    "GetFriendlyName": ((), ("FriendlyName",)),
+    "ChangeFriendlyName": (("FriendlyName",), ("FriendlyName",)),
+    "GetHKSetupInfo": ((), ("HKSetupCode", "HKSetupDone")),
+    "ReSetup": (("Reset",), ("Reset",)),
+}
+
+
+def _scpd():
+    def args(names, direction):
+        return "".join(f"<argument><name>{n}</name><direction>{direction}</direction>"
+                       f"<relatedStateVariable>{n}</relatedStateVariable></argument>" for n in names)
+    actions = "".join(f"<action><name>{name}</name><argumentList>{args(i, 'in')}{args(o, 'out')}</argumentList></action>"
+                      for name, (i, o) in ACTIONS.items())
+    return ('<?xml version="1.0"?>\n<scpd xmlns="urn:Belkin:service-1-0">'
+            '<specVersion><major>1</major><minor>0</minor></specVersion>'
+            f'<actionList>{actions}</actionList><serviceStateTable/></scpd>\n')
+
+SCPD_XML = _scpd()
+
+ENVELOPE = ('<?xml version="1.0"?>\n<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" '
+            's:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body>{body}</s:Body></s:Envelope>')
+FAULT = ('<s:Fault><faultcode>s:Client</faultcode><faultstring>UPnPError</faultstring><detail>'
+         '<UPnPError xmlns="urn:schemas-upnp-org:control-1-0"><errorCode>{code}</errorCode>'
+         '<errorDescription>{desc}</errorDescription></UPnPError></detail></s:Fault>')
+
+
+def _escape(text):
+    return str(text).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+class FakeWemo:
+    """State of one simulated plug."""
+    def __init__(self, index, host, port, name=None, seed=0):
+        self.index = index
+        self.host = host
+        self.port = port
+        self.mac = f"{BELKIN_OUI}{index:06X}"
+        self.serial = f"221{index:09d}"
+        self.udn = f"uuid:Socket-1_0-{self.serial}"
+        self.name = name or f"Sim Plug {index:03d}"
+        self.state = 0
+        self.hk_code = f"{index % 1000:03d}-{index % 100:02d}-{index % 1000:03d}"
+        self.lock = threading.Lock()
+        self.calls = {}
+        # Own RNG per plug: its misbehaviour doesn't depend on how other plugs' threads interleave
+        self.rng = random.Random(f"{seed}:{index}")
+
+    def roll(self):
+        with self.lock: return self.rng.random()
+
+    def setup_xml(self):
+        return SETUP_XML.format(name=_escape(self.name), serial=self.serial, udn=self.udn, mac=self.mac,
+                                state=self.state, service=BASICEVENT)
+
+    def call(self, action, args):
+        """Runs a basicevent action; returns {out arg: value}."""
+        with self.lock:
+            self.calls[action] = self.calls.get(action, 0) + 1
+            if action == "SetBinaryState":
+                self.state = 1 if str(args.get("BinaryState", "0")).strip()[:1] == "1" else 0
+            elif action == "ChangeFriendlyName":
+                self.name = args.get("FriendlyName") or self.name
+            elif action == "ReSetup" and args.get("Reset") == "2":
+                self.state, self.name = 0, "Wemo Mini"
+            return {
+                "GetBinaryState": {"BinaryState": self.state},
+                "SetBinaryState": {"BinaryState": self.state},
+                "GetFriendlyName": {"FriendlyName": self.name},
+                "ChangeFriendlyName": {"FriendlyName": self.name},
+                "GetHKSetupInfo": {"HKSetupCode": self.hk_code, "HKSetupDone": 1},
+                "ReSetup": {"Reset": "success"},
+            }[action]
+
+    def info(self):
+        return {"name": self.name, "ip": self.host, "port": self.port, "mac": self.mac,
+                "serial": self.serial, "udn": self.udn, "state": self.state}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args): pass
+
+    def _misbehave(self):
+        """Applies latency/loss for this request; returns False if the request is 'lost'."""
+        fleet, dev = self.server.fleet, self.server.device
+        delay = fleet.latency + fleet.jitter * (2 * dev.roll() - 1) if fleet.latency or fleet.jitter else 0
+        if delay > 0: time.sleep(delay)
+        if fleet.loss and dev.roll() < fleet.loss:
+            fleet.count("lost")
+            time.sleep(fleet.stall)
+            self.close_connection = True
+            return False
+        return True
+
+    def _reply(self, status, body, content_type='text/xml; charset="utf-8"'):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if not self._misbehave(): return
+        dev = self.server.device
+        if self.path == "/setup.xml": return self._reply(200, dev.setup_xml())
+        if self.path == "/eventservice.xml": return self._reply(200, SCPD_XML)
+        self._reply(404, "Not Found", "text/plain")
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode("utf-8", "replace")
+        if not self._misbehave(): return
+        fleet, dev = self.server.fleet, self.server.device
+        action = (self.headers.get("SOAPACTION") or "").strip('"').rpartition("#")[2]
+        if self.path != "/upnp/control/basicevent1" or action not in ACTIONS:
+            return self._reply(500, ENVELOPE.format(body=FAULT.format(code=401, desc="Invalid Action")))
+        if fleet.flaky and dev.roll() < fleet.flaky:
+            fleet.count("faults")
+            return self._reply(500, ENVELOPE.format(body=FAULT.format(code=501, desc="Action Failed")))
+        args = {name: m.group(1) for name in ACTIONS[action][0]
+                for m in [re.search(f"<{name}>(.*?)</{name}>", body, re.S)] if m}
+        out = "".join(f"<{k}>{_escape(v)}</{k}>" for k, v in dev.call(action, args).items())
+        fleet.count(action)
+        self._reply(200, ENVELOPE.format(body=f'<u:{action}Response xmlns:u="{BASICEVENT}">{out}</u:{action}Response>'))
+
+
+class Fleet:
+    """N fake plugs, each on its own (host, port). Usable from benchmarks:
+
+        with Fleet(100, subnet="127.0.1.0/24") as fleet:
+            ...scan "127.0.1.0/24"...
+    """
+    def __init__(self, count, subnet=None, host="127.0.0.1", port=49153, base_port=None,
+                 latency=0.0, jitter=0.0, loss=0.0, stall=5.0, flaky=0.0, seed=0):
+        self.latency, self.jitter, self.loss, self.stall, self.flaky = latency, jitter, loss, stall, flaky
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+        if base_port is None:
+            hosts = list(ipaddress.ip_network(subnet or "127.0.1.0/24", strict=False).hosts())
+            if count > len(hosts): raise ValueError(f"{subnet} only has {len(hosts)} addresses")
+            slots = [(str(hosts[i]), port) for i in range(count)]
+        else:
+            slots = [(host, base_port + i) for i in range(count)]
+        self.devices = [FakeWemo(i + 1, h, p, seed=seed) for i, (h, p) in enumerate(slots)]
+        self.servers = []
+
+    def count(self, key):
+        with self.stats_lock: self.stats[key] = self.stats.get(key, 0) + 1
+
+    def start(self):
+        for dev in self.devices:
+            server = ThreadingHTTPServer((dev.host, dev.port), _Handler)
+            server.daemon_threads = True
+            server.device, server.fleet = dev, self
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self.servers.append(server)
+        return self
+
+    def stop(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        self.servers = []
+
+    def __enter__(self): return self.start()
+    def __exit__(self, *exc): self.stop()
+
+    def manifest(self):
+        return [d.info() for d in self.devices]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Simulate a fleet of Wemo plugs for load testing.")
+    ap.add_argument("--count", type=int, default=50)
+    ap.add_argument("--subnet", default="127.0.1.0/24", help="one loopback alias per device (default)")
+    ap.add_argument("--port", type=int, default=49153, help="port used with --subnet")
+    ap.add_argument("--host", default="127.0.0.1", help="IP used with --base-port")
+    ap.add_argument("--base-port", type=int, help="put every device on --host, one port each")
+    ap.add_argument("--latency", type=float, default=0.0)
+    ap.add_argument("--jitter", type=float, default=0.0)
+    ap.add_argument("--loss", type=float, default=0.0)
+    ap.add_argument("--stall", type=float, default=5.0)
+    ap.add_argument("--flaky", type=float, default=0.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--manifest", help="write the device list as JSON to this file")
+    args = ap.parse_args()
+
+    fleet = Fleet(args.count, subnet=args.subnet, host=args.host, port=args.port, base_port=args.base_port,
+                  latency=args.latency, jitter=args.jitter, loss=args.loss, stall=args.stall,
+                  flaky=args.flaky, seed=args.seed)
+    try: fleet.start()
+    except OSError as e:
+        fleet.stop()
+        sys.exit(f"Could not bind: {e} (on macOS, add loopback aliases or use --base-port)")
+    if args.manifest:
+        with open(args.manifest, "w") as f: json.dump(fleet.manifest(), f, indent=2)
+    first, last = fleet.devices[0], fleet.devices[-1]
+    print(f"Simulating {len(fleet.devices)} Wemo plugs: {first.host}:{first.port} .. {last.host}:{last.port}")
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *a: stop.set())
+    try:
+        while not stop.wait(30):
+            if fleet.stats: print(json.dumps(fleet.stats, sort_keys=True))
+    except KeyboardInterrupt: pass
+    fleet.stop()
+
+
+if __name__ == "__main__":
+    main()
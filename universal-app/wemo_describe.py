@@ -0,0 +1,253 @@
+"""Staged device description loading for large discovery bursts.
+
+pywemo's device_from_description() fetches setup.xml and every service's
+SCPD document and parses them all with lxml on the calling thread, so a deep
+scan of a big fleet ends up CPU-bound on one core. DescriptionLoader splits
+that into stages:
+
+    fetch setup.xml (caller's thread, I/O)
+      -> parse + validate it (process pool)
+      -> fetch each SCPD (caller's thread, I/O)
+      -> parse it (process pool; identical SCPDs across a fleet parse once)
+      -> build the pywemo device from the documents already fetched
+
+For that last step, serving() hooks pywemo's Session.get,
+DeviceDescription.dict_from_xml and ServiceDescription.from_xml so the build
+neither re-fetches nor re-parses. The hooks are installed only for the
+duration of a loader build (one at a time) and act only on the building
+thread; every other pywemo call goes straight to the originals. They rely on
+pywemo internals, so they are only used with PYWEMO_VERSION; any other
+version builds through plain pywemo.
+
+Given a store, the loader also keeps every SCPD it sees (deduplicated by
+hash) so restore() can rebuild a known device at boot from its cached port
+with a single request for setup.xml.
+"""
+import os
+import sys
+import hashlib
+import threading
+import contextlib
+import multiprocessing
+import urllib.parse
+import concurrent.futures
+from collections import OrderedDict
+
+FETCH_TIMEOUT = 5
+PYWEMO_VERSION = "2.1.2"    # what the build hooks were written against; pinned in the builds
+
+
+# --- WORKER SIDE (runs in the pool processes) ---
+def parse_setup(xml):
+    from pywemo.ouimeaux_device.api.xsd_types import DeviceDescription
+    try: return DeviceDescription.dict_from_xml(xml)
+    except Exception: return None
+
+
+def parse_scpd(xml):
+    from pywemo.ouimeaux_device.api.xsd_types import ServiceDescription
+    try: return ServiceDescription.from_xml(xml)
+    except Exception: return None
+
+
+# --- PARSE CACHE ---
+
+
+class _Prefetched:
+    """Stands in for the urllib3 response pywemo reads .data from."""
+    def __init__(self, data):
+        self.data = data
+        self.status = 200
+
+
+class ParseCache:
+    """Bounded LRU of parsed documents keyed by (kind, sha1 of the bytes)."""
+    def __init__(self, size=2048):
+        self.size = size
+        self.lock = threading.Lock()
+        self.items = OrderedDict()
+
+    @staticmethod
+    def key(kind, xml):
+        return kind, hashlib.sha1(xml if isinstance(xml, bytes) else str(xml).encode()).digest()
+
+    def get(self, kind, xml):
+        k = self.key(kind, xml)
+        with self.lock:
+            value = self.items.get(k)
+            if value is not None: self.items.move_to_end(k)
+            return value
+
+    def put(self, kind, xml, value):
+        k = self.key(kind, xml)
+        with self.lock:
+            self.items[k] = value
+            self.items.move_to_end(k)
+            while len(self.items) > self.size: self.items.popitem(last=False)
+
+
+cache = ParseCache()
+
+
+# --- BUILD HOOKS ---
+_ORIGINAL = {}
+_build_lock = threading.Lock()
+_building = threading.local()   # .documents: url -> bytes, set only on the thread inside serving()
+
+
+def _hooks_supported():
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+        try: return version("pywemo") == PYWEMO_VERSION
+        except PackageNotFoundError: return True   # frozen builds ship without metadata; their build pins it
+    except Exception: return False
+
+
+def _get(self, url, **kwargs):
+    docs = getattr(_building, "documents", None)
+    data = docs.get(url) if docs else None
+    return _Prefetched(data) if data is not None else _ORIGINAL["get"](self, url, **kwargs)
+
+
+def _dict_from_xml(setup_xml_content):
+    hit = cache.get("setup", setup_xml_content) if getattr(_building, "documents", None) else None
+    return dict(hit) if hit is not None else _ORIGINAL["setup"](setup_xml_content)
+
+
+def _from_xml(cls, service_xml_content):
+    hit = cache.get("scpd", service_xml_content) if getattr(_building, "documents", None) else None
+    return hit if hit is not None else _ORIGINAL["scpd"](cls, service_xml_content)
+
+
+@contextlib.contextmanager
+def serving(documents):
+    """Within the block, this thread's pywemo builds read `documents` (url -> bytes) instead of
+    fetching them and take parsed documents from the cache. Builds are serialized; pywemo's
+    own methods are put back on exit."""
+    from pywemo.ouimeaux_device.api.xsd_types import DeviceDescription, ServiceDescription
+    from pywemo.ouimeaux_device.api.service import Session
+    hooks = ((DeviceDescription, "dict_from_xml", staticmethod(_dict_from_xml)),
+             (ServiceDescription, "from_xml", classmethod(_from_xml)),
+             (Session, "get", _get))
+    with _build_lock:
+        if not _ORIGINAL:
+            _ORIGINAL.update(setup=DeviceDescription.dict_from_xml, scpd=ServiceDescription.from_xml.__func__,
+                             get=Session.get)
+        saved = [(cls, name, vars(cls)[name]) for cls, name, _ in hooks]
+        for cls, name, hook in hooks: setattr(cls, name, hook)
+        _building.documents = documents
+        try: yield
+        finally:
+            _building.documents = None
+            for cls, name, original in saved: setattr(cls, name, original)
+
+
+# --- LOADER ---
+def document_hash(xml):
+    return hashlib.sha1(xml).hexdigest()
+
+
+class DescriptionLoader:
+    """load(url) -> pywemo device or None, with parsing done in `processes` worker processes
+    (0 = parse in the calling thread; the cache still dedupes identical SCPDs).
+    With a store, SCPDs are saved and documents[location] maps each service's
+    description path to its document hash (what restore() needs later)."""
+    def __init__(self, processes=0, store=None):
+        self.processes = processes
+        self.store = store
+        self.pool = None
+        self.lock = threading.Lock()
+        self.stats = {"fetched": 0, "parsed_remote": 0, "cache_hits": 0, "restored_docs": 0}
+        self.documents = {}
+        self.saved = set()
+        self.session = None
+        self.hooks = _hooks_supported()
+
+    def _pool(self):
+        with self.lock:
+            if self.pool is None and self.processes > 0:
+                # spawn: the server already runs threads, which fork doesn't mix well with
+                self.pool = concurrent.futures.ProcessPoolExecutor(
+                    self.processes, mp_context=multiprocessing.get_context("spawn"))
+            return self.pool
+
+    def _fetch(self, url):
+        if self.session is None:
+            import requests # deferred with pywemo, which pulls it in anyway
+            self.session = requests.Session()
+        r = self.session.get(url, timeout=FETCH_TIMEOUT)
+        r.raise_for_status()
+        self.stats["fetched"] += 1
+        return r.content
+
+    def _parse(self, kind, fn, xml):
+        hit = cache.get(kind, xml)
+        if hit is not None:
+            self.stats["cache_hits"] += 1
+            return hit
+        pool = self._pool()
+        if pool:
+            try:
+                value = pool.submit(fn, xml).result()
+                self.stats["parsed_remote"] += 1
+            except concurrent.futures.process.BrokenProcessPool:
+                with self.lock: self.pool = None
+                value = fn(xml)
+        else: value = fn(xml)
+        if value is not None: cache.put(kind, xml, value)
+        return value
+
+    def load(self, url, docs=None):
+        """docs: {description path: SCPD bytes} already known for this device; only the rest is fetched."""
+        import pywemo
+        import requests
+        docs = docs or {}
+        fetched = {}
+        try:
+            fetched[url] = self._fetch(url)
+            desc = self._parse("setup", parse_setup, fetched[url])
+            if not desc: return None
+            paths, by_hash = {}, {}
+            for svc in desc["_services"]:
+                doc_url = urllib.parse.urljoin(url, svc.description_url)
+                xml = docs.get(svc.description_url)
+                if xml is None: xml = self._fetch(doc_url)
+                else: self.stats["restored_docs"] += 1
+                fetched[doc_url] = xml
+                paths[svc.description_url] = h = document_hash(xml)
+                by_hash[h] = xml
+                self._parse("scpd", parse_scpd, xml)
+            self._remember(url, paths, by_hash)
+            if not self.hooks: return pywemo.discovery.device_from_uuid_and_location(desc["udn"], url)
+            with serving(fetched):
+                return pywemo.discovery.device_from_uuid_and_location(desc["udn"], url)
+        except requests.RequestException: return None
+
+    def restore(self, ip, port, doc_hashes):
+        """Rebuilds a known device at its cached address. doc_hashes ({path: hash}) come from an
+        earlier load(); their SCPDs are read from the store, so only setup.xml goes over the network."""
+        stored = self.store.get_documents(doc_hashes.values()) if self.store and doc_hashes else {}
+        docs = {path: stored[h] for path, h in doc_hashes.items() if h in stored}
+        return self.load(f"http://{ip}:{port}/setup.xml", docs)
+
+    def _remember(self, url, paths, xml_by_hash):
+        self.documents[url] = paths
+        if not self.store: return
+        new = {h: x for h, x in xml_by_hash.items() if h not in self.saved}
+        if not new: return
+        try:
+            self.store.save_documents(new)
+            self.saved.update(new)
+        except Exception: pass  # only costs a fetch at the next restore
+
+    def shutdown(self):
+        with self.lock:
+            if self.pool: self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+
+def default_processes():
+    """Leave a core for the server itself; single-core hosts parse in-thread. Packaged (frozen)
+    builds also parse in-thread until the spawn pool has been checked there."""
+    if getattr(sys, "frozen", False): return 0
+    return max(0, min(4, (os.cpu_count() or 1) - 1))
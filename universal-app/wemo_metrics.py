@@ -0,0 +1,134 @@
+"""Minimal Prometheus metrics for Wemo Ops Server.
+
+Counters, gauges and histograms with labels, rendered in the Prometheus
+text exposition format (0.0.4) by render(). Kept in-house so the server
+image doesn't need an extra dependency.
+"""
+import math
+import threading
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _num(value):
+    if value == math.inf: return "+Inf"
+    if value == -math.inf: return "-Inf"
+    if isinstance(value, float) and value.is_integer(): return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, doc, labels=()):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(l, "")) for l in self.labels)
+
+    def _labels(self, key, extra=()):
+        pairs = list(zip(self.labels, key)) + list(extra)
+        if not pairs: return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    def render(self):
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock: self.values[key] = self.values.get(key, 0) + amount
+
+    def _samples(self):
+        with self.lock: items = sorted(self.values.items())
+        return [f"{self.name}{self._labels(k)} {_num(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Set directly, or pass fn returning a number or {label_tuple: value} read at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name, doc, labels=(), fn=None):
+        super().__init__(name, doc, labels)
+        self.fn = fn
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock: self.values[key] = value
+
+    def _samples(self):
+        if self.fn:
+            try: value = self.fn()
+            except Exception: return []
+            items = sorted(value.items()) if isinstance(value, dict) else [((), value)]
+        else:
+            with self.lock: items = sorted(self.values.items())
+        return [f"{self.name}{self._labels(k)} {_num(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self.values[key] = (counts, total + value)
+
+    def _samples(self):
+        with self.lock: items = sorted((k, (list(c), s)) for k, (c, s) in self.values.items())
+        lines = []
+        for key, (counts, total) in items:
+            running = 0
+            for bound, count in zip(self.buckets, counts):
+                running += count
+                lines.append(f"{self.name}_bucket{self._labels(key, [('le', _num(bound))])} {running}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_num(total)}")
+            lines.append(f"{self.name}_count{self._labels(key)} {running}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, doc, labels=()):
+        return self._add(Counter(name, doc, labels))
+
+    def gauge(self, name, doc, labels=(), fn=None):
+        return self._add(Gauge(name, doc, labels, fn))
+
+    def histogram(self, name, doc, labels=(), buckets=Histogram.DEFAULT_BUCKETS):
+        return self._add(Histogram(name, doc, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics: lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
@@ -1,11 +1,9 @@
+import time
+BOOT_TIME = time.perf_counter() # startup report is measured from here
 import customtkinter as ctk
-import pywemo
 import threading
 import sys
 import os
-import time
-import json
-import requests
 import datetime
 import socket
 import ipaddress
@@ -13,17 +11,18 @@ import subprocess
 import concurrent.futures
 import webbrowser
 import re
+import queue
 import tempfile
 from tkinter import messagebox
+import importlib.util
 import pyperclip
+from wemo_store import get_store, device_id
+from wemo_files import write_json_atomic, load_json, ConfigWatcher
+# pywemo (lxml), requests and qrcode/PIL are imported where they're used: none of them is
+# needed to draw the first window, and together they were most of a cold launch
 
 # --- QR Code & Image Support ---
-try:
-    import qrcode
-    from PIL import Image, ImageTk 
-    HAS_QR = True
-except ImportError:
-    HAS_QR = False
+HAS_QR = all(importlib.util.find_spec(m) for m in ("qrcode", "PIL"))
 
 # --- CONFIGURATION ---
 VERSION = "v5.2.3-Stable"
@@ -31,6 +30,7 @@ SERVER_PORT = 5050
 SERVER_URL = f"http://localhost:{SERVER_PORT}"
 UPDATE_API_URL = "https://api.github.com/repos/qrussell/wemo-ops-center/releases/latest"
 UPDATE_PAGE_URL = "https://github.com/qrussell/wemo-ops-center/releases"
+UPDATE_CHECK_DELAY = 5000 # ms after launch, so the GitHub call stays off the startup path
 
 # --- PATH SETUP ---
 if sys.platform == "darwin":
@@ -45,8 +45,7 @@ if not os.path.exists(APP_DATA_DIR):
     except: pass
 
 PROFILE_FILE = os.path.join(APP_DATA_DIR, "wifi_profiles.json")
-SCHEDULE_FILE = os.path.join(APP_DATA_DIR, "schedules.json")
-SETTINGS_FILE = os.path.join(APP_DATA_DIR, "settings.json")
+PROVISION_CACHE_FILE = os.path.join(APP_DATA_DIR, "provision_methods.json")
 
 # --- STYLING CONSTANTS ---
 COLOR_BG = ("#ebebeb", "#242424")           
@@ -78,6 +77,7 @@ class APIClient:
         self.connected = False
 
     def check_connection(self):
+        import requests
         try:
             r = requests.get(f"{SERVER_URL}/api/status", timeout=0.5)
             if r.status_code == 200:
@@ -89,6 +89,7 @@ class APIClient:
 
     def get_devices(self):
         # [NEW] Fetch device list from Server to avoid broadcast race conditions
+        import requests
         try: return requests.get(f"{SERVER_URL}/api/devices", timeout=1).json()
         except: return []
 
@@ -139,6 +140,79 @@ class NetworkUtils:
         except: pass
         return [ssid for ssid in list(set(wemos)) if "wemo" in ssid.lower() or "belkin" in ssid.lower()]
 
+    @staticmethod
+    def probe_setup_network(ips=("10.22.22.1", "192.168.49.1"), ports=(49153, 49152, 49154)):
+        # Fire every IP/port candidate at once and return the first device that answers
+        import pywemo
+        pairs = [(ip, p) for ip in ips for p in ports]
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(pairs))
+        try:
+            futures = {executor.submit(pywemo.discovery.device_from_description, f"http://{ip}:{p}/setup.xml"): (ip, p) for ip, p in pairs}
+            for future in concurrent.futures.as_completed(futures):
+                try: dev = future.result()
+                except: dev = None
+                if dev:
+                    ip, p = futures[future]
+                    return dev, ip, p
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return None, None, None
+
+# ==============================================================================
+#  NETWORK WATCHER
+# ==============================================================================
+class NetworkWatcher:
+    """Blocks until the host's interfaces, addresses or routes change.
+    Uses a netlink route socket on Linux; elsewhere compares a cheap snapshot of local addresses."""
+    RTMGRP_LINK = 0x1
+    RTMGRP_IPV4_IFADDR = 0x10
+    RTMGRP_IPV4_ROUTE = 0x40
+
+    def __init__(self, poll_interval=2):
+        self.poll_interval = poll_interval
+        self.sock = None
+        if sys.platform.startswith("linux"):
+            try:
+                self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+                self.sock.bind((0, self.RTMGRP_LINK | self.RTMGRP_IPV4_IFADDR | self.RTMGRP_IPV4_ROUTE))
+            except:
+                self.sock = None
+        self.last_snapshot = self._snapshot()
+
+    def _snapshot(self):
+        try:
+            import ifaddr
+            return sorted((a.nice_name, str(ip.ip)) for a in ifaddr.get_adapters() for ip in a.ips)
+        except:
+            return NetworkUtils.get_local_ip()
+
+    def wait_for_change(self, timeout):
+        """Returns True if addressing changed within timeout seconds, False otherwise."""
+        if self.sock:
+            try:
+                self.sock.settimeout(timeout)
+                self.sock.recv(65535)
+                # DHCP/link-up produces a burst of messages; drain it so we only react once
+                self.sock.settimeout(0.5)
+                try:
+                    while True: self.sock.recv(65535)
+                except socket.timeout: pass
+                return True
+            except socket.timeout:
+                return False
+            except OSError:
+                self.sock = None
+
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0: return False
+            time.sleep(min(self.poll_interval, remaining))
+            snap = self._snapshot()
+            if snap != self.last_snapshot:
+                self.last_snapshot = snap
+                return True
+
 # ==============================================================================
 #  DEEP SCANNER
 # ==============================================================================
@@ -155,40 +229,63 @@ class DeepScanner:
             finally: s.close()
         return None
 
-    def scan_subnet(self, target_cidr, status_callback=None):
-        found_devices = []
+    def verify_host(self, ip):
+        import pywemo
+        for port in [49152, 49153, 49154, 49155]:
+            try:
+                url = f"http://{ip}:{port}/setup.xml"
+                dev = pywemo.discovery.device_from_description(url)
+                if dev: return dev
+            except: pass
+        return None
+
+    def iter_subnet(self, target_cidr, progress=None, progress_callback=None):
+        # Generator: yields each device as soon as it is verified while probing continues
+        if progress is None: progress = {}
         try:
             network = ipaddress.ip_network(target_cidr, strict=False)
             all_hosts = list(network.hosts())
-        except: return []
-
-        if status_callback: status_callback(f"Probing {len(all_hosts)} IPs (Deep)...")
-        
-        active_ips = []
-        with concurrent.futures.ThreadPoolExecutor(max_workers=60) as executor:
-            futures = {executor.submit(self.probe_port, ip): ip for ip in all_hosts}
-            for future in concurrent.futures.as_completed(futures):
+        except: return
+
+        progress.update({"hosts_total": len(all_hosts), "hosts_probed": 0, "hosts_open": 0, "verified": 0})
+        if not all_hosts: return
+
+        events = queue.Queue()
+        last_report = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=60) as probe_pool, \
+             concurrent.futures.ThreadPoolExecutor(max_workers=8) as verify_pool:
+            outstanding = len(all_hosts)
+            for ip in all_hosts:
+                probe_pool.submit(self.probe_port, ip).add_done_callback(lambda f: events.put(("probe", f)))
+
+            while outstanding:
+                kind, future = events.get()
+                outstanding -= 1
                 result = future.result()
-                if result: active_ips.append(result)
+                if kind == "probe":
+                    progress["hosts_probed"] += 1
+                    if result:
+                        progress["hosts_open"] += 1
+                        outstanding += 1
+                        verify_pool.submit(self.verify_host, result).add_done_callback(lambda f: events.put(("verify", f)))
+                elif result:
+                    progress["verified"] += 1
+                    yield result
+                if progress_callback and (time.time() - last_report > 0.25 or not outstanding):
+                    last_report = time.time()
+                    progress_callback(progress)
 
-        if status_callback: status_callback(f"Verifying {len(active_ips)} hosts...")
-        
-        for ip in active_ips:
-            for port in [49152, 49153, 49154, 49155]:
-                try:
-                    url = f"http://{ip}:{port}/setup.xml"
-                    dev = pywemo.discovery.device_from_description(url)
-                    if dev: 
-                        found_devices.append(dev)
-                        break 
-                except: pass
-        return found_devices
+    def scan_subnet(self, target_cidr, status_callback=None):
+        def report(p):
+            if status_callback: status_callback(f"Deep: {p['hosts_probed']}/{p['hosts_total']} probed | {p['hosts_open']} open | {p['verified']} verified")
+        return list(self.iter_subnet(target_cidr, progress_callback=report))
 
 class SolarEngine:
     def __init__(self):
         self.lat = None; self.lng = None; self.solar_times = {}; self.last_fetch = None
     
     def detect_location(self):
+        import requests
         try:
             r = requests.get("https://ipinfo.io/json", timeout=2)
             data = r.json()
@@ -205,6 +302,7 @@ class SolarEngine:
         if not self.lat:
             if not self.detect_location(): return None
 
+        import requests
         try:
             url = f"https://api.sunrise-sunset.org/json?lat={self.lat}&lng={self.lng}&formatted=0"
             r = requests.get(url, timeout=5)
@@ -233,6 +331,7 @@ class UpdateManager:
     @staticmethod
     def check_for_updates(current_version_str, api_url):
         if not api_url: return False, None
+        import requests
         try:
             headers = {'User-Agent': 'WemoOps-Updater'}
             r = requests.get(api_url, headers=headers, timeout=3)
@@ -276,7 +375,15 @@ class WifiAutomator:
 #  MAIN APP
 # ==============================================================================
 class WemoOpsApp(ctk.CTk):
+    # Tabs are built the first time they're shown (see ensure_tab)
+    TABS = {"dash": "create_dashboard", "prov": "create_provisioner", "sched": "create_schedule_ui",
+            "maint": "create_maintenance_ui", "settings": "create_settings_ui"}
+    # Long-running workers, started once by start_background() when something needs them
+    BACKGROUND = {"connection_monitor": "_connection_monitor", "scheduler": "_scheduler_engine",
+                  "state_poller": "_state_poller"}
+
     def __init__(self):
+        self.startup_report = {"imports_ms": round((time.perf_counter() - BOOT_TIME) * 1000, 1)}
         super().__init__()
         self.title(f"Wemo Ops Center {VERSION}")
         self.geometry("1100x800")
@@ -287,12 +394,15 @@ class WemoOpsApp(ctk.CTk):
         self.grid_rowconfigure(0, weight=1)
 
         self.api = APIClient() 
-        self.settings = self.load_json(SETTINGS_FILE, dict)
-        self.profiles = self.load_json(PROFILE_FILE, dict)
-        self.schedules = self.load_json(SCHEDULE_FILE, list) or []
+        # Settings + schedules are shared with the server through wemo_ops.db
+        self.store = get_store(APP_DATA_DIR)
+        self.settings = self.store.get_settings()
+        self.profiles = load_json(PROFILE_FILE, dict)
+        self.schedules = self.store.list_schedules()
         self.saved_subnets = self.settings.get("subnets", [])
         
-        self.known_devices_map = {}
+        self.known_devices_map = {}  # device id (MAC) -> pywemo device
+        self.device_choice = {}      # dropdown label -> device id
         self.device_switches = {} 
         self.last_rendered_device_names = [] 
         self.solar = SolarEngine()
@@ -300,6 +410,8 @@ class WemoOpsApp(ctk.CTk):
         self.current_setup_ip = None
         self.current_setup_port = None
         self.manual_override_active = False
+        self.threads = {}
+        self.render_pending = False
 
         if "lat" in self.settings:
             self.solar.lat = self.settings["lat"]
@@ -340,32 +452,22 @@ class WemoOpsApp(ctk.CTk):
         self.content.pack(fill="both", expand=True, padx=20, pady=20)
 
         self.frames = {}
-        self.create_dashboard()
-        self.create_provisioner()
-        self.create_schedule_ui()
-        self.create_maintenance_ui()
-        self.create_settings_ui()
-        
+        self.monitoring = True
         self.show_tab("dash")
         self.after(500, self.refresh_network)
         
-        self.monitoring = True
-        threading.Thread(target=self._connection_monitor, daemon=True).start()
-        threading.Thread(target=self._scheduler_engine, daemon=True).start()
-        threading.Thread(target=self.run_update_check, daemon=True).start()
-        threading.Thread(target=self._state_poller, daemon=True).start()
+        # Always on (it mostly sleeps on the store watcher): rules added later through the shared
+        # store must fire in LOCAL mode even if the Automation tab is never opened
+        self.after(1000, lambda: self.start_background("scheduler"))
+        self.after(UPDATE_CHECK_DELAY, lambda: threading.Thread(target=self.run_update_check, daemon=True).start())
         
         self.server_heartbeat()
+        self.mark_startup("window")
+        self.after_idle(self.finish_startup_report)
 
     # --- HELPERS ---
-    def load_json(self, p, t): 
-        if os.path.exists(p): 
-            try: 
-                with open(p) as f: return json.load(f)
-            except: pass
-        return t()
     def save_json(self, p, d):
-        with open(p, 'w') as f: json.dump(d, f)
+        write_json_atomic(p, d)
     def set_ui_scale(self, s):
         try: ctk.set_widget_scaling(int(str(s).replace("%", ""))/100)
         except: pass
@@ -390,7 +492,33 @@ class WemoOpsApp(ctk.CTk):
         btn.pack(pady=2, padx=10, fill="x")
         setattr(self, f"btn_{view_name}", btn)
         return btn
+    def ensure_tab(self, name):
+        if name not in self.frames:
+            t0 = time.perf_counter()
+            getattr(self, self.TABS[name])()
+            self.startup_report[f"tab_{name}_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        return self.frames[name]
+
+    def start_background(self, name):
+        if name in self.threads: return
+        self.threads[name] = threading.Thread(target=getattr(self, self.BACKGROUND[name]), name=name, daemon=True)
+        self.threads[name].start()
+
+    def mark_startup(self, step):
+        self.startup_report[f"{step}_ms"] = round((time.perf_counter() - BOOT_TIME) * 1000, 1)
+
+    def finish_startup_report(self):
+        """Runs once the first window has been drawn. The report is printed, saved next to the
+        settings (windowed builds have no console) and shown on the Settings tab."""
+        self.mark_startup("first_paint")
+        r = self.startup_report
+        print(f"Startup: {r['first_paint_ms']:.0f} ms to first paint (imports {r['imports_ms']:.0f} ms, window {r['window_ms']:.0f} ms)")
+        try: write_json_atomic(os.path.join(APP_DATA_DIR, "startup_report.json"), dict(r, version=VERSION, frozen=bool(getattr(sys, 'frozen', False))), indent=2)
+        except: pass
+        if "--startup-report" in sys.argv: self.after(0, self.quit)
+
     def show_tab(self, name):
+        self.ensure_tab(name)
         for key, frame in self.frames.items(): frame.pack_forget()
         self.frames[name].pack(fill="both", expand=True)
         for key in ["dash", "prov", "sched", "maint", "settings"]:
@@ -400,14 +528,22 @@ class WemoOpsApp(ctk.CTk):
         active_btn.configure(fg_color=COLOR_FRAME, text_color=COLOR_TEXT)
 
     def server_heartbeat(self):
+        # The check runs off the UI thread; the label is updated when it's done
+        threading.Thread(target=self._heartbeat_task, daemon=True).start()
+        self.after(5000, self.server_heartbeat)
+
+    def _heartbeat_task(self):
         self.api.check_connection()
+        self.after(0, self.update_mode_label)
+
+    def update_mode_label(self):
+        if "sched" not in self.frames: return
         try:
             if self.api.connected:
                 self.sched_mode_lbl.configure(text="MODE: SERVER (Remote)", text_color=COLOR_ACCENT)
             else:
                 self.sched_mode_lbl.configure(text="MODE: LOCAL (PC)", text_color="orange")
         except: pass
-        self.after(5000, self.server_heartbeat)
 
     # --- DASHBOARD ---
     def create_dashboard(self):
@@ -443,7 +579,7 @@ class WemoOpsApp(ctk.CTk):
         if s and s not in self.saved_subnets:
             self.saved_subnets.append(s)
             self.settings["subnets"] = self.saved_subnets
-            self.save_json(SETTINGS_FILE, self.settings)
+            self.store.update_settings({"subnets": self.saved_subnets})
             self.subnet_combo.configure(values=self.saved_subnets)
             self.scan_status.configure(text="Subnet Saved")
             
@@ -452,7 +588,7 @@ class WemoOpsApp(ctk.CTk):
         if s in self.saved_subnets:
             self.saved_subnets.remove(s)
             self.settings["subnets"] = self.saved_subnets
-            self.save_json(SETTINGS_FILE, self.settings)
+            self.store.update_settings({"subnets": self.saved_subnets})
             self.subnet_combo.configure(values=self.saved_subnets)
             self.subnet_combo.set(NetworkUtils.get_subnet_cidr()) 
             self.scan_status.configure(text="Subnet Deleted")
@@ -471,6 +607,7 @@ class WemoOpsApp(ctk.CTk):
 
     def _server_sync_task(self):
         # [NEW] Download devices from Server API (Instant)
+        import pywemo
         try:
             devices_data = self.api.get_devices()
             new_map = {}
@@ -484,7 +621,7 @@ class WemoOpsApp(ctk.CTk):
                             url = f"http://{ip}:{port}/setup.xml"
                             dev = pywemo.discovery.device_from_description(url)
                             if dev:
-                                new_map[dev.name] = dev
+                                new_map[self.dev_id(dev)] = dev
                                 break
                         except: pass
             
@@ -498,20 +635,32 @@ class WemoOpsApp(ctk.CTk):
 
     def _scan_task(self, subnet, use_deep):
         def log(m): self.after(0, lambda: self.scan_status.configure(text=m))
+        def report(p): log(f"Deep: {p['hosts_probed']}/{p['hosts_total']} probed | {p['hosts_open']} open | {p['verified']} verified")
         try:
+            import pywemo
             log("Quick Scan (SSDP)...")
             new_map = {}
-            for d in pywemo.discover_devices(): 
-                new_map[d.name] = d
+            previous = dict(self.known_devices_map)
+
+            def found(d):
+                # Show each device as soon as it is verified; stale entries are pruned at the end
+                new_map[self.dev_id(d)] = d
+                self.known_devices_map = {**previous, **new_map}
+                self.after(0, self.request_render)
+
+            for entry in pywemo.ssdp.scan():
+                d = pywemo.discovery.device_from_uuid_and_location(entry.udn, entry.location)
+                if d:
+                    found(d)
+                    log(f"Quick Scan (SSDP)... {len(new_map)} found")
             
             if use_deep and subnet:
                 log(f"Deep Probing {subnet}...")
-                deep_devs = self.scanner.scan_subnet(subnet, status_callback=log) 
-                for d in deep_devs:
-                    new_map[d.name] = d
+                for d in self.scanner.iter_subnet(subnet, progress_callback=report):
+                    found(d)
             
             self.known_devices_map = new_map
-            log("Done.")
+            log(f"Done. {len(new_map)} devices.")
             self.after(0, self.render_devices)
             self.after(0, self.update_maint_dropdown)
             self.after(0, self.update_schedule_dropdown)
@@ -520,22 +669,44 @@ class WemoOpsApp(ctk.CTk):
     def refresh_network(self):
         self.run_local_scan()
 
+    @staticmethod
+    def dev_id(dev):
+        return device_id(getattr(dev, 'mac', None), getattr(dev, 'udn', None), dev.name)
+
+    def device_labels(self):
+        """Dropdown label -> device id. Names aren't unique; duplicates get the MAC tail appended."""
+        counts = {}
+        for d in self.known_devices_map.values(): counts[d.name] = counts.get(d.name, 0) + 1
+        self.device_choice = {(d.name if counts[d.name] == 1 else f"{d.name} ({i[-4:]})"): i
+                              for i, d in self.known_devices_map.items()}
+        return sorted(self.device_choice)
+
+    def request_render(self):
+        """Coalesces renders while a scan streams devices in: at most one every 250 ms (UI thread only)."""
+        if self.render_pending: return
+        self.render_pending = True
+        self.after(250, self._render_pending)
+
+    def _render_pending(self):
+        self.render_pending = False
+        self.render_devices()
+
     def render_devices(self):
         self.device_switches = {}
-        current_names = sorted(list(self.known_devices_map.keys()))
+        current_names = sorted((d.name, i) for i, d in self.known_devices_map.items())
         if current_names == self.last_rendered_device_names: return 
         self.last_rendered_device_names = current_names
         
         for w in self.dev_list.winfo_children(): w.destroy()
-        devs = list(self.known_devices_map.values())
-        if not devs: 
+        if not self.known_devices_map: 
             ctk.CTkLabel(self.dev_list, text="No devices found.", text_color=COLOR_TEXT).pack(pady=20)
             return
         
-        for dev in sorted(devs, key=lambda x: x.name):
-            self.build_device_card(dev)
+        for dev_id, dev in sorted(self.known_devices_map.items(), key=lambda x: x[1].name):
+            self.build_device_card(dev_id, dev)
+        self.start_background("state_poller")
 
-    def build_device_card(self, dev):
+    def build_device_card(self, dev_id, dev):
         try: mac = getattr(dev, 'mac', "Unknown")
         except: mac = "Unknown"
         try: serial = getattr(dev, 'serial_number', "Unknown")
@@ -548,7 +719,7 @@ class WemoOpsApp(ctk.CTk):
         def tog(d=dev): threading.Thread(target=d.toggle, daemon=True).start()
         sw = ctk.CTkSwitch(t, text="Power", command=tog, text_color=COLOR_TEXT); sw.pack(side="right")
         
-        self.device_switches[dev.name] = sw
+        self.device_switches[dev_id] = sw
         
         try:
             state = dev.get_state(force_update=False) 
@@ -598,20 +769,20 @@ class WemoOpsApp(ctk.CTk):
                         continue
                 except: pass
 
-                for name, dev in self.known_devices_map.items():
-                    if name in self.device_switches:
+                for dev_id, dev in list(self.known_devices_map.items()):
+                    if dev_id in self.device_switches:
                         try:
                             # FORCE UPDATE from physical device
                             state = dev.get_state(force_update=True)
-                            self.after(0, lambda n=name, s=state: self._update_switch_safe(n, s))
+                            self.after(0, lambda i=dev_id, s=state: self._update_switch_safe(i, s))
                         except: pass
             except: pass
             time.sleep(2) 
 
-    def _update_switch_safe(self, name, state):
-        if name in self.device_switches:
+    def _update_switch_safe(self, dev_id, state):
+        if dev_id in self.device_switches:
             try:
-                sw = self.device_switches[name]
+                sw = self.device_switches[dev_id]
                 if state: sw.select()
                 else: sw.deselect()
             except: pass
@@ -644,6 +815,7 @@ class WemoOpsApp(ctk.CTk):
         self.override_link = ctk.CTkLabel(rc, text="[Manual Override]", font=("Arial", 10, "underline"), text_color="gray", cursor="hand2"); self.override_link.pack(anchor="e", pady=(0, 5)); self.override_link.bind("<Button-1>", lambda e: self.force_unlock())
         ctk.CTkLabel(rc, text="Live Operation Log", font=FONT_BODY, text_color=COLOR_TEXT).pack(anchor="w")
         self.prov_log = ctk.CTkTextbox(rc, font=FONT_MONO, activate_scrollbars=True); self.prov_log.pack(fill="both", expand=True)
+        self.start_background("connection_monitor")
 
     def run_provision_thread(self):
         ssid = self.ssid_entry.get()
@@ -656,6 +828,7 @@ class WemoOpsApp(ctk.CTk):
     def _provision_task(self, s, p, n, ip, pt):
         self.log_prov(f"--- Configuring {ip} ---")
         try:
+            import pywemo
             url = f"http://{ip}:{pt or 49153}/setup.xml"
             self.log_prov(f"Targeting URL: {url}")
             dev = pywemo.discovery.device_from_description(url)
@@ -666,17 +839,7 @@ class WemoOpsApp(ctk.CTk):
                 time.sleep(1)
             
             self.log_prov("Starting Adaptive Encryption Loop (Smart Loop)...")
-            success = False
-            for m in [2,1,0]:
-                for length in [True, False]:
-                    try: 
-                        self.log_prov(f"Attempting: Method {m}, Len={length}...")
-                        dev.setup(ssid=s, password=p, _encrypt_method=m, _add_password_lengths=length)
-                        self.log_prov("SUCCESS! Credentials Accepted.")
-                        success = True
-                        break
-                    except: pass
-                if success: break
+            success = self._brute_force_provision(dev, s, p)
             
             if success: self.log_prov("Device is rebooting. Connect PC back to Home Wi-Fi.")
             else: self.log_prov("FAILED: All attempts rejected by device.")
@@ -684,6 +847,32 @@ class WemoOpsApp(ctk.CTk):
         except Exception as e: self.log_prov(f"Error: {e}")
         self.prov_btn.configure(state="normal", text="Push Configuration")
 
+    def _brute_force_provision(self, dev, ssid, pwd):
+        # Try the (method, length) combo that last worked for this model/firmware first
+        key = f"{getattr(dev, 'model_name', '?')}|{getattr(dev, 'firmware_version', '?')}"
+        cache = load_json(PROVISION_CACHE_FILE, dict)
+        attempts = [(m, length) for m in [2, 1, 0] for length in [True, False]]
+        known = cache.get(key)
+        if known and (known.get("method"), known.get("lengths")) in attempts:
+            attempts.remove((known["method"], known["lengths"]))
+            attempts.insert(0, (known["method"], known["lengths"]))
+            self.log_prov(f"Learned method for {key}: Method {known['method']}, Len={known['lengths']}")
+
+        for m, length in attempts:
+            try:
+                self.log_prov(f"Attempting: Method {m}, Len={length}...")
+                dev.setup(ssid=ssid, password=pwd, _encrypt_method=m, _add_password_lengths=length)
+                self.log_prov("SUCCESS! Credentials Accepted.")
+                same = known and known.get("method") == m and known.get("lengths") == length
+                cache[key] = {"method": m, "lengths": length,
+                              "successes": known.get("successes", 0) + 1 if same else 1,
+                              "last_used": datetime.date.today().isoformat()}
+                try: self.save_json(PROVISION_CACHE_FILE, cache)
+                except: pass
+                return True
+            except: pass
+        return False
+
     def log_prov(self, m): self.prov_log.insert("end", f"{m}\n"); self.prov_log.see("end")
     
     def scan_ssids(self):
@@ -798,6 +987,9 @@ class WemoOpsApp(ctk.CTk):
         
         self.render_jobs()
         self.update_solar_data()
+        self.update_schedule_dropdown()
+        self.update_mode_label()
+        self.start_background("scheduler")
 
     def on_sched_type_change(self, choice):
         if choice == "Time (Fixed)":
@@ -817,22 +1009,21 @@ class WemoOpsApp(ctk.CTk):
                 self.after(0, lambda: self.loc_lbl.configure(text=txt, text_color="gray"))
                 self.settings["lat"] = self.solar.lat
                 self.settings["lng"] = self.solar.lng
-                self.save_json(SETTINGS_FILE, self.settings)
+                self.store.update_settings({"lat": self.solar.lat, "lng": self.solar.lng})
             else: self.after(0, lambda: self.loc_lbl.configure(text="Location Failed.", text_color="red"))
         threading.Thread(target=task, daemon=True).start()
 
     def update_schedule_dropdown(self):
-        names = sorted([d.name for d in self.known_devices_map.values()])
+        if "sched" not in self.frames: return
+        names = self.device_labels()
         if names: 
             self.sched_dev_combo.configure(values=names)
             self.sched_dev_combo.set(names[0])
 
     def add_job(self):
-        # [SAFETY] Reload latest data from disk before modifying
-        if os.path.exists(SCHEDULE_FILE):
-            self.schedules = self.load_json(SCHEDULE_FILE, list)
-
-        dev = self.sched_dev_combo.get()
+        label = self.sched_dev_combo.get()
+        dev_id = self.device_choice.get(label)
+        dev = self.known_devices_map[dev_id].name if dev_id in self.known_devices_map else label
         action = self.sched_action_combo.get()
         sType = self.sched_type_combo.get()
         val = self.sched_val_entry.get()
@@ -852,9 +1043,9 @@ class WemoOpsApp(ctk.CTk):
         if sType != "Time (Fixed)":
             if self.sched_offset_combo.get() == "- (Before)": offset_mod = -1
             
-        job = {"id": int(time.time()), "device": dev, "action": action, "type": sType, "value": val, "offset_dir": offset_mod, "days": active_days, "last_run": ""}
-        self.schedules.append(job)
-        self.save_json(SCHEDULE_FILE, self.schedules)
+        job = {"id": int(time.time()), "device": dev, "device_id": dev_id, "action": action, "type": sType, "value": val, "offset_dir": offset_mod, "days": active_days, "last_run": ""}
+        self.store.add_schedule(job)
+        self.schedules = self.store.list_schedules()
         self.render_jobs()
 
     def render_jobs(self):
@@ -878,26 +1069,32 @@ class WemoOpsApp(ctk.CTk):
             ctk.CTkButton(row, text="Del", width=40, fg_color=COLOR_DANGER, command=lambda j=job: self.delete_job(j["id"])).pack(side="right", padx=5)
 
     def delete_job(self, jid):
-        self.schedules = [j for j in self.schedules if j["id"] != jid]
-        self.save_json(SCHEDULE_FILE, self.schedules)
+        self.store.delete_schedule(jid)
+        self.schedules = self.store.list_schedules()
         self.render_jobs()
 
     def _scheduler_engine(self):
-        last_mtime = 0
+        # Commits land in the WAL file (or the db itself after a checkpoint)
+        db_name = os.path.basename(self.store.path)
+        watcher = ConfigWatcher(APP_DATA_DIR, [db_name, db_name + "-wal"])
+        last_version = None
+        changed = True
         while self.monitoring:
             try:
-                if os.path.exists(SCHEDULE_FILE):
-                    current_mtime = os.path.getmtime(SCHEDULE_FILE)
-                    if current_mtime != last_mtime:
-                        last_mtime = current_mtime
-                        new_data = self.load_json(SCHEDULE_FILE, list)
+                if changed:
+                    # data_version only moves when another connection (UI thread, server) commits
+                    version = self.store.data_version()
+                    if version != last_version:
+                        last_version = version
+                        new_data = self.store.list_schedules()
                         if new_data != self.schedules:
                             self.schedules = new_data
-                            if self.frames["sched"].winfo_ismapped():
+                            sched = self.frames.get("sched")
+                            if sched and sched.winfo_ismapped():
                                 self.after(0, self.render_jobs)
                 
                 if self.api.connected:
-                    time.sleep(2) 
+                    changed = watcher.wait_for_change(2)
                     continue
 
                 now = datetime.datetime.now()
@@ -906,7 +1103,7 @@ class WemoOpsApp(ctk.CTk):
                 current_hhmm = now.strftime("%H:%M")
                 solar = self.solar.get_solar_times()
                 
-                dirty = False
+                ran = {}
                 for job in self.schedules:
                     if weekday not in job['days']: continue
                     
@@ -925,18 +1122,19 @@ class WemoOpsApp(ctk.CTk):
                     if trigger_time == current_hhmm and job.get('last_run') != today_str:
                         self.execute_job(job)
                         job['last_run'] = today_str
-                        dirty = True
+                        ran[job['id']] = today_str
                 
-                if dirty:
-                    self.save_json(SCHEDULE_FILE, self.schedules)
-                    last_mtime = os.path.getmtime(SCHEDULE_FILE)
+                if ran:
+                    self.store.set_last_run(ran)
 
             except Exception as e: pass
-            time.sleep(2) 
+            changed = watcher.wait_for_change(2)
 
     def execute_job(self, job):
-        dev_name = job['device']
-        dev = next((d for d in self.known_devices_map.values() if d.name == dev_name), None)
+        # Rules made before device ids existed only carry the name
+        dev = self.known_devices_map.get(job.get('device_id'))
+        if dev is None and not job.get('device_id'):
+            dev = next((d for d in self.known_devices_map.values() if d.name == job['device']), None)
         if dev:
             try:
                 if job['action'] == "Turn ON": dev.on()
@@ -965,14 +1163,16 @@ class WemoOpsApp(ctk.CTk):
         ctk.CTkLabel(c3, text="Factory Reset", font=FONT_H2, text_color=("#aa0000", "#ff4444")).pack(pady=(15,5))
         ctk.CTkLabel(c3, text="Full Wipe (Out of Box)", text_color="gray").pack(pady=5)
         ctk.CTkButton(c3, text="NUKE (Reset=2)", fg_color=COLOR_MAINT_BTN_R, text_color="#ffffff", command=lambda: self.run_reset_command(2)).pack(pady=15)
+        self.update_maint_dropdown()
 
     def update_maint_dropdown(self):
-        names = sorted([d.name for d in self.known_devices_map.values()])
+        if "maint" not in self.frames: return
+        names = self.device_labels()
         if names: self.maint_dev_combo.configure(values=names); self.maint_dev_combo.set(names[0])
             
     def run_reset_command(self, reset_code):
         name = self.maint_dev_combo.get()
-        dev = next((d for d in self.known_devices_map.values() if d.name == name), None)
+        dev = self.known_devices_map.get(self.device_choice.get(name))
         if not dev: return messagebox.showerror("Error", "Device not found.")
         if not messagebox.askyesno("Confirm Reset", f"Reset '{name}' (Code {reset_code})?"): return
         def task():
@@ -992,13 +1192,18 @@ class WemoOpsApp(ctk.CTk):
         r2 = ctk.CTkFrame(c, fg_color="transparent"); r2.pack(fill="x", padx=20, pady=10)
         ctk.CTkLabel(r2, text="UI Scaling:", font=FONT_BODY, text_color=COLOR_TEXT).pack(side="left")
         ctk.CTkComboBox(r2, values=["80%", "90%", "100%", "110%", "120%", "150%"], command=self.change_scaling, variable=ctk.StringVar(value=self.settings.get("scale", "100%")), width=150).pack(side="right")
+        d = ctk.CTkFrame(f, fg_color=COLOR_CARD); d.pack(fill="x", pady=10, padx=5)
+        ctk.CTkLabel(d, text="Diagnostics", font=FONT_H2, text_color=COLOR_TEXT).pack(padx=20, pady=(15,5), anchor="w")
+        report = " | ".join(f"{k[:-3]}: {v:.0f} ms" for k, v in self.startup_report.items())
+        ctk.CTkLabel(d, text=f"Startup: {report}", font=FONT_MONO, text_color=COLOR_SUBTEXT, wraplength=700, justify="left").pack(padx=20, pady=(0, 15), anchor="w")
 
-    def change_theme(self, m): ctk.set_appearance_mode(m); self.settings["theme"]=m; self.save_json(SETTINGS_FILE, self.settings)
-    def change_scaling(self, s): self.set_ui_scale(s); self.settings["scale"]=s; self.save_json(SETTINGS_FILE, self.settings)
+    def change_theme(self, m): ctk.set_appearance_mode(m); self.settings["theme"]=m; self.store.update_settings({"theme": m})
+    def change_scaling(self, s): self.set_ui_scale(s); self.settings["scale"]=s; self.store.update_settings({"scale": s})
 
     # --- QR CODE ---
     def show_qr_code(self):
         try:
+            import qrcode
             # Generate QR for Local IP + Server Port
             ip = NetworkUtils.get_local_ip()
             url = f"http://{ip}:{SERVER_PORT}"
@@ -1052,28 +1257,35 @@ class WemoOpsApp(ctk.CTk):
         h, n = UpdateManager.check_for_updates(VERSION, UPDATE_API_URL)
         if h: self.after(0, lambda: self.btn_update.configure(text=f"⬇ Get {n}") or self.btn_update.pack(side="bottom", padx=10, pady=(0, 10)))
 
-    # [REPLACE] existing _connection_monitor with this throttled version:
-
     def _connection_monitor(self):
+        # Event driven: only probe the setup IPs when the host's addressing changes
+        # (joining/leaving a Wemo.Mini network), plus a slow safety re-check.
+        watcher = NetworkWatcher()
+        pending = True
+        followups = 0
+        last_check = 0
         while self.monitoring:
-            # OPTIMIZATION: Pause monitoring if we aren't in the Provisioner tab
+            # OPTIMIZATION: Don't probe if we aren't in the Provisioner tab (still track changes)
             try:
                 if not self.frames["prov"].winfo_ismapped():
-                    time.sleep(2)
+                    if watcher.wait_for_change(2): pending = True
                     continue
             except: pass
 
             if self.manual_override_active: time.sleep(5); continue
-            found = False
-            for ip in ["10.22.22.1", "192.168.49.1"]:
-                for p in [49153, 49152, 49154]:
-                    try: 
-                        d = pywemo.discovery.device_from_description(f"http://{ip}:{p}/setup.xml")
-                        if d: self.current_setup_ip=ip; self.current_setup_port=p; self.after(0, lambda: self.set_status_connected(d, ip, p)); found=True; break
-                    except: pass
-                if found: break
-            if not found: self.current_setup_ip=None; self.after(0, self.set_status_disconnected)
-            time.sleep(5)
+            if pending or followups or time.time() - last_check > 60:
+                if pending: followups = 3  # Device web server may come up a few seconds after DHCP
+                pending = False
+                last_check = time.time()
+                d, ip, p = NetworkUtils.probe_setup_network()
+                if d:
+                    followups = 0
+                    self.current_setup_ip=ip; self.current_setup_port=p
+                    self.after(0, lambda d=d, ip=ip, p=p: self.set_status_connected(d, ip, p))
+                else:
+                    followups = max(0, followups - 1)
+                    self.current_setup_ip=None; self.after(0, self.set_status_disconnected)
+            if watcher.wait_for_change(3 if followups else 10): pending = True
 
     def set_status_connected(self, d, i, p):
         self.status_frame.configure(fg_color=("#d0f0c0", "#1a331a"), border_color="#28a745"); self.status_lbl_icon.configure(text="OK"); self.status_lbl_text.configure(text="CONNECTED", text_color="#28a745"); self.status_lbl_sub.configure(text=f"Found: {d.name} ({i}:{p})", text_color=COLOR_TEXT); self.prov_btn.configure(state="normal", text="Push Configuration"); self.override_link.pack_forget()
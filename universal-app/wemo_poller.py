@@ -0,0 +1,116 @@
+"""Sharded device polling for Wemo Ops Server.
+
+With settings["poller_processes"] = N > 0 the server starts N poller worker
+processes instead of its poller thread. Each worker owns the devices whose id
+falls in its shard of a consistent-hash ring, so changing N only moves about
+1/N of the devices. Workers read the device list from the shared SQLite store
+(written by the scanning process), poll their shard with their own pywemo
+objects and publish state into the store's device_state table, which the API
+process reads. Polling then scales with cores instead of one GIL.
+"""
+import time
+import bisect
+import hashlib
+import logging
+import multiprocessing
+
+from wemo_store import get_store
+
+WEMO_PORTS = (49153, 49152, 49154, 49155)
+RESOLVE_BACKOFF_MAX = 300   # seconds between resolve attempts for a device that keeps failing
+
+
+class ShardRing:
+    """Consistent-hash ring of `shards` shards with `vnodes` points each."""
+    def __init__(self, shards, vnodes=64):
+        self.shards = shards
+        points = sorted((self._hash(f"{shard}:{v}"), shard) for shard in range(shards) for v in range(vnodes))
+        self.hashes = [h for h, _ in points]
+        self.owners = [s for _, s in points]
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.md5(str(key).encode()).digest()[:8], "big")
+
+    def shard_of(self, key):
+        i = bisect.bisect(self.hashes, self._hash(key)) % len(self.hashes)
+        return self.owners[i]
+
+
+def resolve(ip, port=None):
+    """Builds the device at ip, trying its cached port first."""
+    import pywemo
+    for port in dict.fromkeys([p for p in (port, *WEMO_PORTS) if p]):
+        try:
+            dev = pywemo.discovery.device_from_description(f"http://{ip}:{port}/setup.xml")
+            if dev: return dev
+        except Exception: pass
+    return None
+
+
+def poll_worker(data_dir, shard, shards, interval=2, refresh=5):
+    """Worker process main loop: owns the devices the ring assigns to `shard`.
+    Re-reads the device list every `refresh` seconds (one query; only new devices get resolved)."""
+    logging.getLogger("pywemo").setLevel(logging.CRITICAL)
+    parent = multiprocessing.parent_process()
+    store = get_store(data_dir)
+    ring = ShardRing(shards)
+    devices = {}        # id -> pywemo device
+    addresses = {}      # id -> ip it was resolved at
+    retry = {}          # id -> (next attempt ts, current delay, ip) for devices that failed to resolve
+    last_refresh = 0
+    # daemon=True only covers a clean exit; stop on our own if the server was killed
+    while parent is None or parent.is_alive():
+        if time.time() - last_refresh > refresh:
+            last_refresh = time.time()
+            # Agent-owned devices aren't reachable from here; their agent reports them
+            mine = {i: d for i, d in store.list_devices().items()
+                    if not d.get("agent") and d.get("ip") and ring.shard_of(i) == shard}
+            for dev_id in [i for i in devices if addresses.get(i) != mine.get(i, {}).get("ip")]:
+                devices.pop(dev_id, None)
+            for dev_id, row in mine.items():
+                if dev_id in devices: continue
+                wait = retry.get(dev_id)
+                if wait and wait[2] == row["ip"] and wait[0] > time.time(): continue
+                # Offline/stale rows back off so they don't stall polling of the rest of the shard
+                dev = resolve(row["ip"], row.get("port"))
+                if dev:
+                    devices[dev_id], addresses[dev_id] = dev, row["ip"]
+                    retry.pop(dev_id, None)
+                else:
+                    delay = min(RESOLVE_BACKOFF_MAX, wait[1] * 2) if wait and wait[2] == row["ip"] else refresh
+                    retry[dev_id] = (time.time() + delay, delay, row["ip"])
+        rows = []
+        for dev_id, dev in devices.items():
+            t0 = time.time()
+            try:
+                state = dev.get_state(force_update=True)
+                rows.append((dev_id, state, time.time() - t0, time.time(), shard))
+            except Exception:
+                rows.append((dev_id, None, None, time.time(), shard))
+        if rows:
+            try: store.publish_states(rows)
+            except Exception: pass
+        time.sleep(interval)
+
+
+class PollerPool:
+    """Starts and supervises the worker processes (restarting any that die)."""
+    def __init__(self, data_dir, processes, interval=2):
+        self.data_dir = data_dir
+        self.count = processes
+        self.interval = interval
+        # spawn, not fork: the server process already has threads running
+        self.ctx = multiprocessing.get_context("spawn")
+        self.procs = [None] * processes
+
+    def ensure_running(self):
+        for shard, proc in enumerate(self.procs):
+            if proc is None or not proc.is_alive():
+                proc = self.ctx.Process(target=poll_worker, args=(self.data_dir, shard, self.count, self.interval),
+                                        name=f"wemo-poller-{shard}", daemon=True)
+                proc.start()
+                self.procs[shard] = proc
+
+    def alive(self):
+        return sum(1 for p in self.procs if p and p.is_alive())
@@ -1,25 +1,44 @@
 import os
 import sys
-import json
 import time
+BOOT_TIME = time.time() # startup timings in /api/status are measured from here
 import threading
 import datetime
 import socket
 import logging
 import ipaddress
+import queue
+from collections import deque
+import math
+import hmac
+from array import array
 import concurrent.futures
-import requests
-from flask import Flask, render_template, jsonify, request
+import multiprocessing
+import urllib.parse
+from flask import Flask, Response, render_template, jsonify, request
 from waitress import serve
+from wemo_store import get_store, device_id
+from wemo_telemetry import TelemetryStore, InsightCollector, DEFAULT_RETENTION, RESOLUTIONS, device_key
+from wemo_metrics import REGISTRY as METRICS, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from wemo_poller import PollerPool
+from wemo_describe import DescriptionLoader, default_processes
 
 # --- CONFIGURATION ---
 VERSION = "v5.2.3-1"
 PORT = int(os.environ.get("PORT", 5050)) # Custom port option, mainly for Docker at this time.
 HOST = "0.0.0.0"
 SCAN_INTERVAL = int(os.environ.get("SCAN_INTERVAL", 300)) # Time in seconds between automatic scans (default 5 minutes). Mainly for Docker at this time.
+# Agent mode: scan/poll a VLAN the central server can't reach and report into it (see MULTI-AGENT)
+AGENT_UPSTREAM = os.environ.get("AGENT_UPSTREAM", "").rstrip("/")   # central server URL; set = run as an agent
+AGENT_NAME = os.environ.get("AGENT_NAME") or socket.gethostname()
+AGENT_URL = os.environ.get("AGENT_URL", "").rstrip("/")             # how the central server reaches this agent
+AGENT_TOKEN = os.environ.get("AGENT_TOKEN", "")                     # shared secret, required on both sides
+AGENT_PUSH_INTERVAL = float(os.environ.get("AGENT_PUSH_INTERVAL", 5))
 
 # --- PATH SETUP ---
-if sys.platform == "win32":
+if os.environ.get("WEMO_DATA_DIR"): # Override, e.g. for benchmarks or a second instance
+    APP_DATA_DIR = os.environ["WEMO_DATA_DIR"]
+elif sys.platform == "win32":
     APP_DATA_DIR = os.path.join(os.getenv('APPDATA'), "WemoOps")
 else:
     if os.geteuid() == 0:
@@ -31,9 +50,10 @@ if not os.path.exists(APP_DATA_DIR):
     try: os.makedirs(APP_DATA_DIR)
     except: pass
 
-SCHEDULE_FILE = os.path.join(APP_DATA_DIR, "schedules.json")
-SETTINGS_FILE = os.path.join(APP_DATA_DIR, "settings.json")
-DEVICES_FILE = os.path.join(APP_DATA_DIR, "devices.json")
+# schedules / settings / device cache live in wemo_ops.db (see wemo_store.py)
+store = get_store(APP_DATA_DIR)
+# Insight power samples and rollups (see wemo_telemetry.py)
+telemetry = InsightCollector(TelemetryStore(os.path.join(APP_DATA_DIR, "telemetry")))
 
 # --- LOGGING ---
 logging.basicConfig(
@@ -58,51 +78,198 @@ for handler in logging.root.handlers:
 
 app = Flask(__name__)
 
+# --- DEVICE REGISTRY ---
+class DeviceRegistry:
+    """Devices keyed by a stable id (MAC, else UDN, else name; see wemo_store.device_id), with
+    secondary indexes by friendly name and IP. Names aren't unique, so a name maps to a set of ids.
+
+    Copy-on-write: writers serialize on a lock and publish a new (devices, by_name, by_ip) view;
+    readers grab the current view without locking, so iteration never sees a dict change size.
+    Entry dicts are shared between views and updated in place, so a thread holding an entry
+    (poller, toggle) keeps writing to the live one. Field changes that leave name/IP alone need
+    no new view; other writes copy the dicts once per call and adjust the indexes incrementally."""
+    INDEXED = ("name", "ip")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.view = ({}, {}, {})
+
+    @staticmethod
+    def _index(by_name, by_ip, dev_id, entry, add):
+        name, ip = entry.get("name"), entry.get("ip")
+        ids = by_name.get(name, frozenset())
+        ids = ids | {dev_id} if add else ids - {dev_id}
+        if ids: by_name[name] = ids
+        else: by_name.pop(name, None)
+        if ip:
+            if add: by_ip[ip] = dev_id
+            elif by_ip.get(ip) == dev_id: del by_ip[ip]
+
+    @classmethod
+    def _in_place(cls, entry, fields):
+        """Merges fields into a live entry if no indexed field changes; returns False (untouched) otherwise."""
+        if any(k in fields and fields[k] != entry.get(k) for k in cls.INDEXED): return False
+        entry.update(fields)
+        return True
+
+    def _merge(self, changes, replace=True, create=True):
+        # Lock held. changes: {id: fields}
+        devices, by_name, by_ip = self.view
+        added, reindex = {}, []     # reindex: (id, its old name/IP)
+        for dev_id, fields in changes.items():
+            entry = devices.get(dev_id)
+            if entry is None:
+                if create: added[dev_id] = dict(fields, id=dev_id)
+            elif replace and not self._in_place(entry, fields):
+                reindex.append((dev_id, {k: entry.get(k) for k in self.INDEXED}))
+                entry.update(fields)
+        if not added and not reindex: return
+        if added: devices = {**devices, **added}
+        by_name, by_ip = dict(by_name), dict(by_ip)
+        for dev_id, old in reindex:
+            self._index(by_name, by_ip, dev_id, old, add=False)
+            self._index(by_name, by_ip, dev_id, devices[dev_id], add=True)
+        for dev_id, entry in added.items(): self._index(by_name, by_ip, dev_id, entry, add=True)
+        self.view = (devices, by_name, by_ip)
+
+    def _drop(self, ids):
+        # Lock held
+        devices, by_name, by_ip = self.view
+        ids = [i for i in ids if i in devices]
+        if not ids: return
+        devices, by_name, by_ip = dict(devices), dict(by_name), dict(by_ip)
+        for dev_id in ids: self._index(by_name, by_ip, dev_id, devices.pop(dev_id), add=False)
+        self.view = (devices, by_name, by_ip)
+
+    def upsert(self, dev_id, fields, replace=True):
+        """Adds an entry, or merges fields into the existing one. With replace=False an existing
+        entry is left alone, so cached data never overwrites a live device object."""
+        self.upsert_many({dev_id: fields}, replace)
+
+    def upsert_many(self, changes, replace=True):
+        """upsert() for {id: fields}, publishing one view for the whole batch."""
+        with self.lock: self._merge(changes, replace)
+
+    def update(self, dev_id, **fields):
+        """Changes fields of an existing entry (no-op if it's gone)."""
+        self.update_many({dev_id: fields})
+
+    def update_many(self, changes):
+        """{id: fields} for existing entries; gone ones are skipped."""
+        with self.lock: self._merge(changes, create=False)
+
+    def remove(self, dev_id):
+        with self.lock: self._drop([dev_id])
+
+    def prune(self, stale):
+        """Removes entries for which stale(entry) is true, checked under the lock; returns their ids."""
+        with self.lock:
+            gone = [i for i, e in self.view[0].items() if stale(e)]
+            self._drop(gone)
+            return gone
+
+    def get(self, dev_id):
+        return self.view[0].get(dev_id)
+
+    def ids_for_name(self, name):
+        return set(self.view[1].get(name, ()))
+
+    def find(self, ref):
+        """Entry for an id, an unambiguous friendly name, or an IP."""
+        devices, by_name, by_ip = self.view
+        if ref in devices: return devices[ref]
+        ids = by_name.get(ref)
+        if ids and len(ids) == 1: return devices.get(next(iter(ids)))
+        return devices.get(by_ip.get(ref))
+
+    def items(self): return list(self.view[0].items())
+    def values(self): return list(self.view[0].values())
+    def __len__(self): return len(self.view[0])
+
+def dev_identity(dev):
+    return device_id(getattr(dev, 'mac', None), getattr(dev, 'udn', None), dev.name)
+
 # --- GLOBAL STATE ---
-device_registry = {}
+device_registry = DeviceRegistry()
 scan_status = "Idle"
+scan_progress = {}
+scan_cycle = 0
 settings = {}
 solar_times = {}
+startup = {"phase": "starting"}  # ms since BOOT_TIME at each step of __main__ (see /api/status)
 
-# --- UTILS ---
-def load_json(path, default=None):
-    if default is None: default = {}
-    if os.path.exists(path):
-        try:
-            with open(path, 'r') as f: return json.load(f)
-        except: pass
-    return default
+def startup_mark(step):
+    startup[f"{step}_ms"] = round((time.time() - BOOT_TIME) * 1000, 1)
 
-def save_json(path, data):
-    try:
-        with open(path, 'w') as f: json.dump(data, f, indent=2)
-    except Exception as e:
-        logger.error(f"Failed to save JSON: {e}")
+# --- METRICS ---
+soap_latency = METRICS.histogram("wemo_soap_request_seconds", "Round trip of SOAP calls to devices", ("device", "op"))
+scan_phase_seconds = METRICS.histogram("wemo_scan_phase_seconds", "Duration of each discovery phase", ("phase",),
+                                       buckets=(0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600))
+scheduler_delay = METRICS.histogram("wemo_scheduler_fire_delay_seconds", "Time a rule fired after its intended time",
+                                    buckets=(0.5, 1, 2, 5, 10, 15, 30, 45, 60, 120, 300))
+scheduler_jobs = METRICS.counter("wemo_scheduler_jobs_total", "Scheduled rule outcomes", ("result",))
+errors_total = METRICS.counter("wemo_errors_total", "Exceptions caught in background loops", ("subsystem", "type"))
+METRICS.gauge("wemo_devices", "Devices in the registry", ("status",), fn=lambda: {
+    ("online",): sum(1 for d in device_registry.values() if d.get("obj")),
+    ("offline",): sum(1 for d in device_registry.values() if not d.get("obj"))})
+METRICS.gauge("wemo_scan_queue_depth", "Hosts waiting in the deep scan executors", ("pool",), fn=lambda: {
+    ("probe",): scan_progress.get("probe_pending", 0), ("verify",): scan_progress.get("verify_pending", 0)})
+METRICS.gauge("wemo_scheduler_jobs_inflight", "Scheduled actions waiting for or holding a worker", ("state",),
+              fn=lambda: {(k,): v for k, v in jobs_inflight.items()})
+METRICS.gauge("wemo_poller_processes", "Sharded poller worker processes alive",
+              fn=lambda: poller_pool.alive() if poller_pool else 0)
+METRICS.gauge("wemo_history_spill_pending", "State history samples waiting to be written", fn=lambda: len(history.pending))
+METRICS.gauge("wemo_telemetry_pending_rows", "Telemetry rows waiting to be written",
+              fn=lambda: sum(len(r) for r in list(telemetry.pending.values())))
+
+def count_error(subsystem, e):
+    errors_total.inc(subsystem=subsystem, type=type(e).__name__)
 
+# --- UTILS ---
 def save_device_cache():
     cache_data = {}
-    for name, data in device_registry.items():
-        cache_data[name] = {
+    for dev_id, data in device_registry.items():
+        cache_data[dev_id] = {
+            "name": data.get("name"),
             "ip": data.get("ip"),
             "mac": data.get("mac"),
             "serial": data.get("serial"),
             "state": data.get("state", 0),
-            "last_seen": data.get("last_seen", 0)
+            "last_seen": data.get("last_seen", 0),
+            "agent": data.get("agent"),
+            "port": data.get("port"),
+            "docs": data.get("docs")
         }
-    save_json(DEVICES_FILE, cache_data)
+    try: store.save_devices(cache_data)
+    except Exception as e: logger.error(f"Failed to save device cache: {e}")
 
 def load_device_cache():
-    global device_registry
-    cache = load_json(DEVICES_FILE, {})
-    for name, data in cache.items():
-        device_registry[name] = {
-            "obj": None,
-            "ip": data.get("ip"),
-            "mac": data.get("mac"),
-            "serial": data.get("serial"),
-            "state": data.get("state", 0),
-            "last_seen": data.get("last_seen", 0)
-        }
+    cache = store.list_devices()
+    # Only fills in devices we don't have (replace=False); a scan must not reset live entries back to obj=None
+    device_registry.upsert_many({dev_id: {
+        "obj": None,
+        "name": data.get("name") or dev_id,
+        "ip": data.get("ip"),
+        "mac": data.get("mac"),
+        "serial": data.get("serial"),
+        "state": data.get("state", 0),
+        "last_seen": data.get("last_seen", 0),
+        "agent": data.get("agent"),
+        "port": data.get("port"),
+        "docs": data.get("docs")
+    } for dev_id, data in cache.items()}, replace=False)
+
+def sync_schedule_ids():
+    """Pins rules to stable device ids (rules created before ids existed only name their device)
+    and keeps each rule's display name current when its device is renamed."""
+    for job in store.list_schedules():
+        entry = device_registry.get(job.get('device_id'))
+        if entry:
+            if entry.get("name") and entry["name"] != job.get('device'):
+                store.update_schedule(job['id'], {"device": entry["name"]})
+        elif not job.get('device_id'):
+            ids = device_registry.ids_for_name(job.get('device'))
+            if len(ids) == 1: store.update_schedule(job['id'], {"device_id": ids.pop()})
 
 def get_solar_times():
     global solar_times
@@ -112,13 +279,14 @@ def get_solar_times():
     lat = settings.get('lat')
     lng = settings.get('lng')
     
+    import requests # deferred: only needed once a day, and costs ~70ms at startup
     if not lat: 
         try:
             r = requests.get("https://ipinfo.io/json", timeout=2)
             loc = r.json().get("loc", "").split(",")
             lat, lng = loc[0], loc[1]
             settings['lat'] = lat; settings['lng'] = lng
-            save_json(SETTINGS_FILE, settings)
+            store.update_settings({'lat': lat, 'lng': lng})
         except: return None
         
     try:
@@ -138,6 +306,10 @@ def get_solar_times():
 
 # --- DEEP SCANNER ---
 class DeepScanner:
+    # MAC prefixes Belkin has shipped Wemo hardware under
+    BELKIN_OUIS = ("94:10:3e", "14:91:82", "ec:1a:59", "08:86:3b", "c4:41:1e",
+                   "b4:75:0e", "58:ef:68", "24:f5:a2", "60:38:e0", "30:23:03")
+
     def probe_port(self, ip, ports=[49152, 49153, 49154, 49155], timeout=0.6):
         for port in ports:
             s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -150,9 +322,16 @@ class DeepScanner:
             finally: s.close()
         return None
 
-    def scan_subnet(self, subnets):
-        import pywemo
-        found_ips = []
+    def verify_host(self, ip):
+        for port in [49152, 49153, 49154, 49155]:
+            try:
+                url = f"http://{ip}:{port}/setup.xml"
+                dev = get_describer().load(url)
+                if dev: return dev
+            except: pass
+        return None
+
+    def expand_hosts(self, subnets):
         all_hosts = []
         for subnet in subnets:
             try:
@@ -160,161 +339,911 @@ class DeepScanner:
                 net = ipaddress.ip_network(subnet.strip(), strict=False)
                 all_hosts.extend([str(ip) for ip in net.hosts()])
             except: pass
+        return all_hosts
 
-        if not all_hosts: return []
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=60) as executor:
-            futures = {executor.submit(self.probe_port, ip): ip for ip in all_hosts}
-            for future in concurrent.futures.as_completed(futures):
+    def iter_hosts(self, hosts, progress=None, known_ips=()):
+        """Yields devices the moment they are verified. Open hosts are verified
+        while the rest of the sweep is still probing. known_ips skip the TCP
+        probe and go straight to verification."""
+        if progress is None: progress = {}
+        progress.update({"hosts_total": len(hosts) + len(known_ips), "hosts_probed": 0, "hosts_open": 0, "verified": 0,
+                         "probe_pending": len(hosts), "verify_pending": len(known_ips)})
+        if not hosts and not known_ips: return
+
+        events = queue.Queue()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=60) as probe_pool, \
+             concurrent.futures.ThreadPoolExecutor(max_workers=8) as verify_pool:
+            outstanding = len(hosts) + len(known_ips)
+            for ip in known_ips:
+                progress["hosts_probed"] += 1
+                progress["hosts_open"] += 1
+                verify_pool.submit(self.verify_host, ip).add_done_callback(lambda f: events.put(("verify", f)))
+            for ip in hosts:
+                probe_pool.submit(self.probe_port, ip).add_done_callback(lambda f: events.put(("probe", f)))
+
+            while outstanding:
+                kind, future = events.get()
+                outstanding -= 1
                 result = future.result()
-                if result: found_ips.append(result)
+                if kind == "probe":
+                    progress["hosts_probed"] += 1
+                    progress["probe_pending"] -= 1
+                    if result:
+                        progress["hosts_open"] += 1
+                        progress["verify_pending"] += 1
+                        outstanding += 1
+                        verify_pool.submit(self.verify_host, result).add_done_callback(lambda f: events.put(("verify", f)))
+                else:
+                    progress["verify_pending"] -= 1
+                    if result:
+                        progress["verified"] += 1
+                        yield result
 
-        devices = []
-        for ip in found_ips:
-            for port in [49152, 49153, 49154, 49155]:
-                try:
-                    url = f"http://{ip}:{port}/setup.xml"
-                    try:
-                        dev = pywemo.discovery.device_from_description(url)
-                        if dev: 
-                            devices.append(dev)
-                            break
+    def iter_subnet(self, subnets, progress=None):
+        return self.iter_hosts(self.expand_hosts(subnets), progress)
+
+    # --- NEIGHBOR TABLE PRE-FILTER (Linux) ---
+    def local_networks(self):
+        """Directly connected IPv4 networks from /proc/net/route, or None if unavailable."""
+        if not sys.platform.startswith("linux"): return None
+        nets = []
+        try:
+            with open("/proc/net/route") as f:
+                for line in f.readlines()[1:]:
+                    parts = line.split()
+                    if len(parts) < 8 or parts[0] == "lo" or parts[2] != "00000000": continue
+                    dest = socket.inet_ntoa(bytes.fromhex(parts[1])[::-1])
+                    mask = socket.inet_ntoa(bytes.fromhex(parts[7])[::-1])
+                    if dest == "0.0.0.0": continue
+                    nets.append(ipaddress.ip_network(f"{dest}/{mask}", strict=False))
+        except: return None
+        return nets
+
+    def read_neighbors(self):
+        """{ip: mac} for complete entries in /proc/net/arp, or None if unavailable."""
+        table = {}
+        try:
+            with open("/proc/net/arp") as f:
+                for line in f.readlines()[1:]:
+                    parts = line.split()
+                    if len(parts) >= 4 and parts[2] != "0x0" and parts[3] != "00:00:00:00:00:00":
+                        table[parts[0]] = parts[3].lower()
+        except: return None
+        return table
+
+    def arp_sweep(self, hosts, chunk=256, settle=0.5):
+        """Makes the kernel ARP each host by sending it an empty UDP datagram (no root needed).
+        Sent in chunks so the neighbor table (gc_thresh) isn't flooded; returns the merged table."""
+        table = {}
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.setblocking(False)
+        try:
+            for i in range(0, len(hosts), chunk):
+                for ip in hosts[i:i + chunk]:
+                    try: s.sendto(b"", (ip, 9))
                     except: pass
-                except: pass
+                time.sleep(settle)
+                table.update(self.read_neighbors() or {})
+        finally: s.close()
+        return table
+
+    def prefilter_hosts(self, hosts, sweep=False):
+        """Drops on-link hosts that aren't in the neighbor table and puts Belkin OUIs first.
+        Routed subnets (no ARP visibility) pass through untouched; any failure returns hosts as-is."""
+        nets = self.local_networks()
+        if not nets: return hosts
+        on_link = {h for h in hosts if any(ipaddress.ip_address(h) in n for n in nets)}
+        if not on_link: return hosts
+
+        table = self.read_neighbors()
+        if table is None: return hosts
+        if sweep: table.update(self.arp_sweep([h for h in hosts if h in on_link]))
+        if not any(h in table for h in on_link): return hosts  # Cold table, don't trust it
+
+        belkin, live, routed = [], [], []
+        for h in hosts:
+            if h not in on_link: routed.append(h)
+            elif h in table: (belkin if table[h][:8] in self.BELKIN_OUIS else live).append(h)
+        return belkin + live + routed
+
+    def plan_differential(self, subnets, known_ips, cycle, slices=4, full_every=12):
+        """Returns (hosts_to_probe, known_ips_to_reverify, label) for one scan cycle.
+        Known devices are always re-verified; the rest of the address space is
+        swept in rotating slices, with a full sweep every full_every cycles."""
+        known = sorted(set(known_ips))
+        known_set = set(known)
+        rest = [h for h in self.expand_hosts(subnets) if h not in known_set]
+        if full_every <= 1 or cycle % full_every == 0:
+            return rest, known, "full"
+        # Count only the partial cycles so every slice gets an equal turn
+        slices = max(1, slices)
+        idx = (cycle - cycle // full_every - 1) % slices
+        return rest[idx::slices], known, f"slice {idx + 1}/{slices}"
+
+    def scan_subnet(self, subnets, on_device=None, progress=None):
+        devices = []
+        for dev in self.iter_subnet(subnets, progress):
+            if on_device: on_device(dev)
+            devices.append(dev)
         return devices
 
+# --- STATE HISTORY ---
+class DeviceHistory:
+    """Fixed-size ring of (ts, state, latency) samples backed by typed arrays (~13 bytes/sample).
+    state is 0/1, or -1 when the device did not answer; latency is seconds (NaN if unknown)."""
+    def __init__(self, size):
+        self.size = size
+        self.ts = array('d', bytes(8 * size))
+        self.state = array('b', bytes(size))
+        self.latency = array('f', bytes(4 * size))
+        self.head = 0
+        self.count = 0
+
+    def append(self, ts, state, latency):
+        i = self.head
+        self.ts[i], self.state[i], self.latency[i] = ts, state, latency
+        self.head = (i + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def oldest(self):
+        return self.ts[(self.head - self.count) % self.size] if self.count else None
+
+    def samples(self, since=0, until=float("inf")):
+        start = (self.head - self.count) % self.size
+        out = []
+        for k in range(self.count):
+            i = (start + k) % self.size
+            if since <= self.ts[i] <= until: out.append((self.ts[i], self.state[i], self.latency[i]))
+        return out
+
+class StateHistory:
+    """Per-device rings fed by the poller and scheduler. A sample is kept when the state changes
+    (including going offline) or at most every `interval` seconds otherwise. With spill enabled,
+    kept samples are also batched into the store so history survives restarts."""
+    def __init__(self, size=2048, interval=60, spill=True):
+        self.size = size
+        self.interval = interval
+        self.spill = spill
+        self.rings = {}
+        self.last = {}  # name -> (ts, state) of the last kept sample
+        self.pending = []
+        self.lock = threading.Lock()
+
+    def _append(self, name, ts, state, latency):
+        ring = self.rings.get(name)
+        if ring is None: ring = self.rings[name] = DeviceHistory(self.size)
+        ring.append(ts, state, math.nan if latency is None else latency)
+        self.last[name] = (ts, state)
+
+    def record(self, name, state, latency=None, force=False):
+        now = time.time()
+        state = -1 if state is None else int(state)
+        with self.lock:
+            prev = self.last.get(name)
+            if not force and prev and prev[1] == state and now - prev[0] < self.interval: return
+            self._append(name, now, state, latency)
+            if self.spill: self.pending.append((name, now, state, latency))
+
+    def flush(self, store):
+        with self.lock:
+            rows, self.pending = self.pending, []
+        if rows: store.add_history(rows)
+
+    def load(self, store, since):
+        """Refills the rings from spilled history after a restart. Runs after the server is up, so
+        samples recorded meanwhile (e.g. a rule firing at boot) are kept after the restored ones."""
+        rows = store.recent_history(since)
+        with self.lock:
+            live = {name: ring.samples() for name, ring in self.rings.items()}
+            self.rings = {}
+            for name, ts, state, latency in rows:
+                if name in live and live[name] and ts >= live[name][0][0]: continue
+                self._append(name, ts, state, latency)
+            for name, samples in live.items():
+                for ts, state, latency in samples: self._append(name, ts, state, latency)
+
+    def query(self, name, since, until, store=None):
+        with self.lock:
+            ring = self.rings.get(name)
+            recent = ring.samples(since, until) if ring else []
+            oldest = ring.oldest() if ring else None
+        older = []
+        if store and self.spill and (oldest is None or since < oldest):
+            cutoff = until if oldest is None else oldest
+            older = [r for r in store.get_history(name, since, cutoff) if r[0] < cutoff]
+        return older + recent
+
+def downsample(samples, since, until, points):
+    """Buckets samples into at most `points` evenly sized windows over [since, until]."""
+    def bucket(ts, group):
+        states = [s for _, s, _ in group]
+        seen = [s for s in states if s >= 0]
+        lat = [l for _, _, l in group if l is not None and not math.isnan(l)]
+        return {
+            "ts": round(ts, 3),
+            "state": states[-1],
+            "on_ratio": round(sum(seen) / len(seen), 3) if seen else None,
+            "offline": len(states) - len(seen),
+            "latency_ms": round(1000 * sum(lat) / len(lat), 1) if lat else None,
+            "latency_max_ms": round(1000 * max(lat), 1) if lat else None,
+            "samples": len(group)
+        }
+    if len(samples) <= points:
+        return 0, [bucket(s[0], [s]) for s in samples]
+    width = (until - since) / points
+    groups = {}
+    for s in samples:
+        groups.setdefault(min(int((s[0] - since) / width), points - 1), []).append(s)
+    return width, [bucket(since + i * width, groups[i]) for i in sorted(groups)]
+
+history = StateHistory()
+
 # --- BACKGROUND TASKS ---
+describer = None
+describer_lock = threading.Lock()
+
+def get_describer():
+    """Shared DescriptionLoader; settings["parse_processes"] sizes its parse pool (0 = in-thread)."""
+    global describer
+    with describer_lock:
+        if describer is None:
+            describer = DescriptionLoader(int(settings.get("parse_processes", default_processes())), store=store)
+        return describer
+
 def register_device(dev):
-    global device_registry
     try:
         mac = getattr(dev, 'mac', 'Unknown')
         serial = getattr(dev, 'serial_number', 'Unknown')
-        device_registry[dev.name] = {
+        dev_id = dev_identity(dev)
+        prev = device_registry.get(dev_id) or {}
+        docs = describer.documents.get(dev.session.url) if describer else None
+        device_registry.upsert(dev_id, {
             "obj": dev,
+            "name": dev.name,
             "ip": dev.host,
             "mac": mac,
             "serial": serial,
-            "state": 0,
-            "last_seen": time.time()
-        }
+            "state": prev.get("state", 0),
+            "last_seen": time.time(),
+            "port": getattr(dev, 'port', None),
+            "docs": docs or prev.get("docs")
+        })
     except Exception as e:
         logger.error(f"Error registering device {dev}: {e}")
 
-def run_scan_cycle():
-    """Performs a SINGLE pass of discovery. Safe for manual or background use."""
-    global scan_status, device_registry
-    
-    # Simple concurrency lock using the status string
-    if scan_status != "Idle":
-        return
+def run_scan_cycle(scan):
+    """Performs a SINGLE pass of discovery; only ever called by the ScanCoordinator.
+    With settings["scan_mode"] == "differential", background passes only re-verify
+    known devices plus a rotating slice of the subnets unless scan["full"]."""
+    global scan_status, scan_progress, scan_cycle
+    full = scan["full"]
 
     try:
         scan_status = "Scanning..."
+        scan_progress = scan["progress"]
+        scan_progress.update({"phase": "ssdp", "started": time.time(), "devices_found": 0})
         import pywemo
         ds = DeepScanner()
         load_device_cache()
         
-        # 1. Standard Discovery
-        devices = pywemo.discover_devices()
-        for dev in devices: register_device(dev)
+        # 1. Standard Discovery (each device is registered as soon as it is built)
+        phase_start = time.time()
+        for entry in pywemo.ssdp.scan():
+            dev = get_describer().load(entry.location)
+            if dev:
+                register_device(dev)
+                scan_progress["devices_found"] += 1
         
-        # 2. Deep Scan
+        # 2. Deep Scan (streams verified devices into the registry)
+        scan_phase_seconds.observe(time.time() - phase_start, phase="ssdp")
         subs = settings.get("subnets", [])
         if subs:
+            phase_start = time.time()
             scan_status = "Deep Scanning..."
-            deep_devs = ds.scan_subnet(subs)
-            for dev in deep_devs: register_device(dev)
+            scan_progress["phase"] = "deep"
+            if settings.get("scan_mode", "full") == "differential" and not full:
+                # Agent-owned devices live on VLANs we can't reach; their agent re-verifies them
+                known_ips = [d.get("ip") for d in device_registry.values()
+                             if d.get("ip") and not (d.get("agent") and not d.get("obj"))]
+                hosts, known_ips, label = ds.plan_differential(
+                    subs, known_ips, scan_cycle,
+                    slices=int(settings.get("scan_slices", 4)),
+                    full_every=int(settings.get("full_scan_every", 12)))
+                scan_cycle += 1
+            else:
+                hosts, known_ips, label = ds.expand_hosts(subs), [], "full"
+            if settings.get("arp_prefilter") and hosts:
+                before = len(hosts)
+                hosts = ds.prefilter_hosts(hosts, sweep=bool(settings.get("arp_sweep")))
+                scan_progress["prefiltered_out"] = before - len(hosts)
+            scan_progress["sweep"] = label
+            for dev in ds.iter_hosts(hosts, scan_progress, known_ips=known_ips):
+                register_device(dev)
+                scan_progress["devices_found"] += 1
+            scan_phase_seconds.observe(time.time() - phase_start, phase="deep")
         
         # 3. Pruning
         now = time.time()
-        to_remove = [n for n, d in device_registry.items() if (now - d.get("last_seen", 0)) > 900]
-        for name in to_remove: del device_registry[name]
+        device_registry.prune(lambda d: (now - d.get("last_seen", 0)) > 900)
 
         save_device_cache()
+        sync_schedule_ids()
+        scan_progress["phase"] = "done"
+        scan_progress["duration"] = round(time.time() - scan_progress["started"], 1)
+        scan_phase_seconds.observe(time.time() - scan_progress["started"], phase="total")
         scan_status = "Idle"
         
     except Exception as e:
         logger.error(f"Scan Error: {e}")
+        count_error("scan", e)
+        scan_progress["phase"] = "error"
         scan_status = "Error"
+        raise
+
+# --- SCAN COORDINATION ---
+class ScanCoordinator:
+    """Runs at most one sweep at a time. A request made while a scan is running joins it, or,
+    if it needs a full sweep the running one won't do, joins the single queued follow-up.
+    Bursts of clicks and the timer overlapping a manual scan never stack up sweeps."""
+    def __init__(self, runner, keep=20):
+        self.runner = runner
+        self.cond = threading.Condition()
+        self.current = None
+        self.pending = None
+        self.recent = deque(maxlen=keep)
+        self.next_id = 1
+
+    def _public(self, scan):
+        return dict(scan, progress=dict(scan["progress"]))
+
+    def request(self, full=False, source="api"):
+        """Returns a snapshot of the scan that will cover this request."""
+        with self.cond:
+            if self.current and (self.current["full"] or not full):
+                scan = self.current
+            elif self.pending:
+                scan = self.pending
+                scan["full"] = scan["full"] or full
+            else:
+                scan = {"id": self.next_id, "full": full, "source": source, "status": "queued",
+                        "requested": time.time(), "requests": 0, "progress": {}}
+                self.next_id += 1
+                if self.current: self.pending = scan
+                else:
+                    self.current = scan
+                    threading.Thread(target=self._run, args=(scan,), daemon=True).start()
+            scan["requests"] += 1
+            return self._public(scan)
+
+    def _run(self, scan):
+        while scan:
+            scan["status"], scan["started"] = "running", time.time()
+            try:
+                self.runner(scan)
+                scan["status"] = "done"
+            except Exception as e:
+                scan["status"], scan["error"] = "error", str(e)
+            scan["finished"] = time.time()
+            with self.cond:
+                self.recent.append(scan)
+                scan, self.pending = self.pending, None
+                self.current = scan
+                self.cond.notify_all()
+
+    def get(self, scan_id=None):
+        """Snapshot of a scan by id, or of the running (else most recent) scan."""
+        with self.cond:
+            scans = [s for s in (self.current, self.pending) if s] + list(reversed(self.recent))
+            if scan_id is not None: scans = [s for s in scans if s["id"] == scan_id]
+            return self._public(scans[0]) if scans else None
+
+    def wait(self, scan_id, timeout=None):
+        """Blocks until the scan has finished; returns its snapshot, or None on timeout/unknown id."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self.cond:
+            while True:
+                done = next((s for s in self.recent if s["id"] == scan_id), None)
+                if done: return self._public(done)
+                if not any(s and s["id"] == scan_id for s in (self.current, self.pending)): return None
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0: return None
+                self.cond.wait(remaining)
+
+scanner = ScanCoordinator(run_scan_cycle)
+
+def restore_devices():
+    """Warm start: rebuilds device objects for every cached entry in parallel, on the cached port
+    and from cached descriptions, so rules and toggles work before the first scan finishes.
+    Each entry's "restore" says how that went; the unreachable ones are left to the poller and scans.
+    startup["restore"] counts each device once: restored, unreachable, or moved (another device answered)."""
+    todo = [(i, e) for i, e in device_registry.items()
+            if not e.get("obj") and not e.get("agent") and e.get("ip") and e.get("port")]
+    summary = startup["restore"] = {"devices": len(todo), "restored": 0, "unreachable": 0, "moved": 0}
+    device_registry.update_many({dev_id: {"restore": "pending"} for dev_id, _ in todo})
+    if not todo: return
+    loader = get_describer()
+
+    def restore(item):
+        dev_id, entry = item
+        try: dev = loader.restore(entry["ip"], entry["port"], entry.get("docs") or {})
+        except Exception: dev = None
+        if dev is None:
+            device_registry.update(dev_id, restore="unreachable")
+            return "unreachable"
+        if dev_identity(dev) != dev_id:
+            # Something else has this address now; register it under its own id and let a scan find ours
+            register_device(dev)
+            device_registry.update(dev_id, restore="unreachable")
+            return "moved"
+        register_device(dev)
+        device_registry.update(dev_id, restore="restored")
+        return "restored"
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(32, len(todo)), thread_name_prefix="restore") as pool:
+        for result in pool.map(restore, todo): summary[result] += 1
+    save_device_cache()
+    logger.info(f"Warm start restored {summary['restored']}/{summary['devices']} devices")
 
 def scanner_loop():
     """Background thread that runs forever."""
     while True:
-        run_scan_cycle()
+        scanner.wait(scanner.request(source="timer")["id"])
         time.sleep(SCAN_INTERVAL) 
 
+def poll_cycle(poll=True):
+    """One pass over the registry: refreshes live devices, re-resolves ones without an object.
+    poll=False only re-resolves (state then comes from the sharded poller workers)."""
+    for dev_id, entry in device_registry.items():
+        name = entry.get("name")
+        dev = entry.get("obj")
+        if entry.get("agent") and not dev: continue  # polled by its agent, which reports state changes
+        if dev:
+            if not poll: continue
+            try:
+                # [FIX] Force update to see external changes (Desktop App / Physical)
+                t0 = time.time()
+                state = dev.get_state(force_update=True)
+                entry['state'] = state
+                entry['last_seen'] = time.time()
+                history.record(dev_id, state, entry['last_seen'] - t0)
+                soap_latency.observe(entry['last_seen'] - t0, device=name, op="get_state")
+            except Exception as e:
+                history.record(dev_id, None)
+                count_error("poller", e)
+        else:
+            ip = entry.get("ip")
+            if ip:
+                error = None
+                for p in dict.fromkeys([entry.get("port"), 49153, 49152, 49154, 49155]):
+                    if not p: continue
+                    try:
+                        url = f"http://{ip}:{p}/setup.xml"
+                        new_dev = get_describer().load(url)
+                        if new_dev: 
+                            register_device(new_dev)
+                            error = None
+                            break
+                    except Exception as e: error = e
+                if error: count_error("reconnect", error)
+
+poller_pool = None
+
+def apply_polled_states(cursor):
+    """Copies states published by the poller workers into the registry; returns the newest publish
+    sequence number seen (the cursor for the next call)."""
+    for dev_id, state, latency, polled, seq in store.device_states(cursor):
+        cursor = max(cursor, seq)
+        entry = device_registry.get(dev_id)
+        if not entry: continue
+        if state is None:
+            history.record(dev_id, None)
+            continue
+        entry['state'] = state
+        entry['last_seen'] = polled
+        history.record(dev_id, state, latency)
+        soap_latency.observe(latency, device=entry.get("name"), op="get_state")
+    return cursor
+
 def poller_loop():
-    """Polls devices for status updates."""
+    """Polls devices for status updates, in this thread or (poller_processes > 0) in sharded
+    worker processes whose results are read back from the store."""
+    global poller_pool
+    last_flush = last_trim = time.time()
+    processes = int(settings.get("poller_processes", 0))
+    if processes > 0:
+        poller_pool = PollerPool(APP_DATA_DIR, processes, interval=2)
+        logger.info(f"Polling with {processes} worker processes")
+    state_cursor = store.state_seq() if poller_pool else 0
     while True:
-        keys = list(device_registry.keys())
-        for name in keys:
-            entry = device_registry[name]
-            dev = entry.get("obj")
-            if dev:
-                try:
-                    # [FIX] Force update to see external changes (Desktop App / Physical)
-                    state = dev.get_state(force_update=True)
-                    entry['state'] = state
-                    entry['last_seen'] = time.time()
-                except: pass
-            else:
-                ip = entry.get("ip")
-                if ip:
-                    for p in [49153, 49152, 49154, 49155]:
-                        try:
-                            url = f"http://{ip}:{p}/setup.xml"
-                            import pywemo
-                            new_dev = pywemo.discovery.device_from_description(url)
-                            if new_dev: 
-                                register_device(new_dev)
-                                break
-                        except: pass
+        if poller_pool:
+            poller_pool.ensure_running()
+            try: state_cursor = apply_polled_states(state_cursor)
+            except Exception as e: count_error("poller", e)
+            # Still resolve device objects here: toggles and scheduled jobs run in this process
+            poll_cycle(poll=False)
+        else:
+            poll_cycle()
+
+        now = time.time()
+        if history.spill and now - last_flush > int(settings.get("history_flush", 60)):
+            last_flush = now
+            try:
+                history.flush(store)
+                if now - last_trim > 3600:
+                    last_trim = now
+                    store.trim_history(now - 86400 * float(settings.get("history_retention_days", 7)))
+            except Exception as e:
+                logger.error(f"History spill failed: {e}")
+                count_error("history", e)
         time.sleep(2)
 
+def telemetry_loop():
+    """Samples power and today's kWh from Insight devices on a configurable cadence."""
+    last_flush = last_prune = time.time()
+    while True:
+        interval = max(2, int(settings.get("insight_interval", 10)))
+        started = time.time()
+        for dev_id, entry in device_registry.items():
+            name = entry.get("name")
+            dev = entry.get("obj")
+            if not dev or not hasattr(dev, "update_insight_params"): continue
+            try:
+                t0 = time.time()
+                dev.update_insight_params()
+                soap_latency.observe(time.time() - t0, device=name, op="insight")
+                telemetry.add_sample(device_key(name, entry.get("mac")), time.time(),
+                                     dev.current_power_watts, dev.today_kwh)
+            except Exception as e: count_error("telemetry", e)
+
+        now = time.time()
+        if now - last_flush > 60:
+            last_flush = now
+            try: telemetry.flush()
+            except Exception as e:
+                logger.error(f"Telemetry flush failed: {e}")
+                count_error("telemetry", e)
+        if now - last_prune > 3600:
+            last_prune = now
+            retention = {**DEFAULT_RETENTION, **settings.get("telemetry_retention", {})}
+            try: telemetry.store.prune(retention)
+            except Exception as e: logger.error(f"Telemetry prune failed: {e}")
+        time.sleep(max(0, interval - (time.time() - started)))
+
+# --- SCHEDULER ---
+schedule_stats = {}                     # job id -> fire counters and the last intended/actual times
+schedule_events = deque(maxlen=200)     # most recent fires / misses, newest last
+missed_today = set()                    # (job id, date) already reported as missed
+scheduler_started = time.time()
+scheduler_pool = None                   # bounded executor for job actions, sized from settings at startup
+scheduler_workers = 8
+jobs_inflight = {"queued": 0, "running": 0}
+jobs_running = set()                    # ids whose device call hasn't returned (including timed-out ones)
+retries = {}                            # job id -> pending retry of a failed action
+
+def job_trigger(job, today, solar):
+    """Today's intended fire time for a rule as a datetime, or None if it can't be worked out yet."""
+    if job['type'] == "Time (Fixed)":
+        return datetime.datetime.combine(today, datetime.datetime.strptime(job['value'], "%H:%M").time())
+    if not solar: return None
+    base = solar['sunrise'] if job['type'] == "Sunrise" else solar['sunset']
+    dt = datetime.datetime.combine(today, datetime.datetime.strptime(base, "%H:%M").time())
+    offset = int(job['value']) * int(job.get('offset_dir', 1))
+    # Offsets that cross midnight still fire today at the same clock time, as before
+    return datetime.datetime.combine(today, (dt + datetime.timedelta(minutes=offset)).time())
+
+def evaluate_rules(jobs, now, solar, grace):
+    """One pass over the rules; no side effects. Returns (due, missed), both lists of
+    (job, intended, lateness): due rules fire now, missed ones are past the grace window."""
+    today_str = now.strftime("%Y-%m-%d")
+    weekday = now.weekday()
+    due, missed = [], []
+    for job in jobs:
+        if weekday not in job.get('days', []): continue
+        if job.get('last_run') == today_str or (job['id'], today_str) in missed_today: continue
+        if job['id'] in retries: continue
+        try: intended = job_trigger(job, now.date(), solar)
+        except Exception as e:
+            count_error("scheduler", e)
+            continue
+        if intended is None or intended > now: continue
+        # Ids are creation timestamps: a rule added after today's trigger minute starts tomorrow
+        if job['id'] >= intended.timestamp() + 60: continue
+        lateness = now.timestamp() - intended.timestamp()
+        (missed if lateness >= grace else due).append((job, intended, lateness))
+    return due, missed
+
+def record_fire(job, intended, status, actual=None, error=None):
+    """status: on_time | late | missed | failed | retried (succeeded on a retry) | gave_up"""
+    stats = schedule_stats.setdefault(job['id'], {
+        "device": job.get('device'), "on_time": 0, "late": 0, "missed": 0, "failed": 0,
+        "retried": 0, "gave_up": 0, "max_delay": 0.0, "total_delay": 0.0})
+    stats[status] += 1
+    delay = None
+    if actual is not None:
+        delay = round(actual - intended.timestamp(), 3)
+        stats["max_delay"] = max(stats["max_delay"], delay)
+        stats["total_delay"] += delay
+    event = {"id": job['id'], "device": job.get('device'), "action": job.get('action'),
+             "intended": intended.isoformat(timespec="minutes"), "actual": actual, "delay": delay, "status": status}
+    if error: event["error"] = error
+    stats["last"] = event
+    schedule_events.append(event)
+    scheduler_jobs.inc(result=status)
+
+def resolve_device(job):
+    """Registry entry for a rule: by its stable device_id (MAC), else by name for rules not yet pinned."""
+    return device_registry.get(job.get('device_id')) or device_registry.find(job['device'])
+
+def run_job(job):
+    """Performs a rule's action; returns None on success or an error string.
+    Retries (job["attempt"] > 0) first re-resolve the device, in case its IP changed."""
+    entry = resolve_device(job)
+    if job.get('attempt') and entry and entry.get("obj"):
+        try:
+            entry["obj"].reconnect_with_device()
+            device_registry.update(entry["id"], ip=entry["obj"].host)
+        except Exception as e: count_error("reconnect", e)
+    if not entry or not (entry.get("obj") or entry.get("agent")): return "device unavailable"
+    try:
+        t0 = time.time()
+        device_action(entry, JOB_ACTIONS[job['action']])
+        history.record(entry["id"], entry['state'], time.time() - t0, force=True)
+        soap_latency.observe(time.time() - t0, device=job['device'], op="action")
+        return None
+    except Exception as e:
+        history.record(entry["id"], None, force=True)
+        count_error("scheduler", e)
+        return f"{type(e).__name__}: {e}"
+
+JOB_ACTIONS = {"Turn ON": "on", "Turn OFF": "off", "Toggle": "toggle"}
+
+def device_action(entry, action):
+    """Runs "on" / "off" / "toggle" on a device, through its owning agent if it lives on another
+    VLAN; updates and returns the entry's state."""
+    if entry.get("obj"):
+        dev = entry["obj"]
+        getattr(dev, action)()
+        # Immediate state update after action
+        entry['state'] = dev.get_state(force_update=True)
+    elif entry.get("agent"):
+        entry['state'] = agent_control(entry["agent"], entry["id"], action)
+    else:
+        raise RuntimeError("device unavailable")
+    return entry['state']
+
+def dispatch_jobs(jobs, timeout):
+    """Runs due jobs on scheduler_pool: different devices in parallel, rules for the same device in
+    order. Each job gets `timeout` seconds once a worker starts it. Returns {job id: error or None}.
+    A timed-out call can't be interrupted; it finishes in the background and its result is dropped.
+    Once a group has an outcome it didn't finish with, none of its remaining jobs are started."""
+    started, finished = {}, {}
+    lock = threading.Lock()     # a job is either started or given up on, never both
+    cancelled = set()           # group keys the dispatcher has given up on
+
+    def run_device(key, group):
+        for i, job in enumerate(group):
+            with lock:
+                if key in cancelled:
+                    jobs_inflight["queued"] -= len(group) - i
+                    return
+                jobs_inflight["queued"] -= 1; jobs_inflight["running"] += 1
+                started[job['id']] = time.time()
+                jobs_running.add(job['id'])
+            try: finished[job['id']] = run_job(job)
+            finally:
+                jobs_inflight["running"] -= 1
+                jobs_running.discard(job['id'])
+
+    groups = {}
+    for job in jobs: groups.setdefault(job.get('device_id') or job['device'], []).append(job)
+    jobs_inflight["queued"] += len(jobs)
+    futures = [scheduler_pool.submit(run_device, k, g) for k, g in groups.items()]
+    # Groups beyond the pool size queue up, so allow them their turn before giving up
+    deadline = time.time() + timeout * (len(groups) // scheduler_workers + 2)
+
+    outcome = {}
+    while len(outcome) < len(jobs):
+        now = time.time()
+        with lock:
+            for key, group in groups.items():
+                blocked = None
+                for job in group:
+                    jid = job['id']
+                    if jid in outcome:
+                        if outcome[jid] and outcome[jid].startswith("timed out"): blocked = outcome[jid]
+                        continue
+                    if jid in finished: outcome[jid] = finished[jid]
+                    elif jid in started and now - started[jid] > timeout: outcome[jid] = blocked = f"timed out after {timeout:g}s"
+                    elif blocked: outcome[jid] = "skipped: device busy with a timed-out job"
+                    elif now > deadline: outcome[jid] = "timed out waiting for a worker"
+                    if jid in outcome and jid not in finished: cancelled.add(key)
+        if len(outcome) < len(jobs):
+            concurrent.futures.wait(futures, timeout=0.25, return_when=concurrent.futures.FIRST_COMPLETED)
+            futures = [f for f in futures if not f.done()]
+    return outcome
+
+def retry_delay(attempt):
+    """Exponential backoff: retry_backoff seconds doubled per attempt, capped at retry_backoff_max."""
+    base = float(settings.get("retry_backoff", 10))
+    return min(base * 2 ** (attempt - 1), float(settings.get("retry_backoff_max", 300)))
+
+def retry_action(job, error, entry):
+    """Action for retrying a failed job, or None if a retry isn't safe. A Toggle must not flip twice
+    if the failed call did land, so it's pinned to the inverse of the device's known state; with no
+    known state it is only retried while the device was never reached."""
+    if job['action'] != "Toggle": return job['action']
+    if entry.get("obj") or entry.get("agent"): return "Turn OFF" if entry.get("state") else "Turn ON"
+    return "Toggle" if error == "device unavailable" else None
+
 def scheduler_loop():
+    """Fires every rule whose intended time has passed today and hasn't run yet. Rules are
+    on time within their trigger minute; later ticks still fire them inside the
+    schedule_grace_minutes window (default 0), after which they're recorded as missed.
+    Jobs due in the same tick run concurrently (see dispatch_jobs). Failed actions are retried
+    with backoff (retry_attempts, default 5) until retry_deadline_minutes after the intended time."""
+    global scheduler_pool, scheduler_workers
+    scheduler_workers = max(1, int(settings.get("scheduler_workers", 8)))
+    scheduler_pool = concurrent.futures.ThreadPoolExecutor(max_workers=scheduler_workers, thread_name_prefix="wemo-job")
     while True:
         try:
             now = datetime.datetime.now()
             today_str = now.strftime("%Y-%m-%d")
-            weekday = now.weekday()
-            current_hhmm = now.strftime("%H:%M")
             solar = get_solar_times()
+            grace = 60 + 60 * float(settings.get("schedule_grace_minutes", 0))
             
-            current_schedules = load_json(SCHEDULE_FILE, [])
-            schedule_modified = False
-
-            for job in current_schedules:
-                if weekday not in job.get('days', []): continue
-                trigger_time = ""
-                if job['type'] == "Time (Fixed)":
-                    trigger_time = job['value']
-                elif solar:
-                    base = solar['sunrise'] if job['type'] == "Sunrise" else solar['sunset']
-                    try:
-                        dt = datetime.datetime.strptime(f"{today_str} {base}", "%Y-%m-%d %H:%M")
-                        offset = int(job['value']) * int(job.get('offset_dir', 1))
-                        trigger_time = (dt + datetime.timedelta(minutes=offset)).strftime("%H:%M")
-                    except: continue
-                
-                if trigger_time == current_hhmm and job.get('last_run') != today_str:
-                    entry = device_registry.get(job['device'])
-                    if entry and entry.get("obj"):
-                        dev = entry["obj"]
-                        try:
-                            if job['action'] == "Turn ON": dev.on()
-                            elif job['action'] == "Turn OFF": dev.off()
-                            elif job['action'] == "Toggle": dev.toggle()
-                            # Immediate state update after action
-                            entry['state'] = dev.get_state(force_update=True)
-                        except: pass
-                    job['last_run'] = today_str
-                    schedule_modified = True
-            
-            if schedule_modified:
-                save_json(SCHEDULE_FILE, current_schedules)
+            current_schedules = store.list_schedules()
+            due, missed = evaluate_rules(current_schedules, now, solar, grace)
+
+            for job, intended, lateness in missed:
+                missed_today.add((job['id'], today_str))
+                reason = "server not running" if intended.timestamp() < scheduler_started else "tick too late"
+                record_fire(job, intended, "missed", error=reason)
+                if reason != "server not running":
+                    logger.warning(f"Missed job {job['id']} ({job['action']} -> {job['device']}), {int(lateness)}s late")
+
+            # Drop retries for rules deleted since they failed
+            live_ids = {job['id'] for job in current_schedules}
+            for jid in [j for j in retries if j not in live_ids]: del retries[jid]
+            retry_due = [r for r in retries.values() if r["next_at"] <= time.time()]
+
+            if due or retry_due:
+                max_attempts = int(settings.get("retry_attempts", 5))
+                retry_window = 60 * float(settings.get("retry_deadline_minutes", 15))
+                actual = time.time()
+                batch = [job for job, _, _ in due] + [r["job"] for r in retry_due]
+                results = dispatch_jobs(batch, float(settings.get("job_timeout", 15)))
+                finished = {}
+
+                for job, intended, lateness in due:
+                    scheduler_delay.observe(max(0, actual - intended.timestamp()))
+                    error = results.get(job['id'])
+                    status = "failed" if error else ("late" if lateness >= 60 else "on_time")
+                    entry = resolve_device(job) or {}
+                    action = retry_action(job, error, entry) if error else None
+                    # A timed-out call may still land; retrying it could act twice
+                    if (action and max_attempts > 0 and job['id'] not in jobs_running
+                            and time.time() + retry_delay(1) < intended.timestamp() + retry_window):
+                        retry_job = dict(job, attempt=1, action=action, device_id=job.get('device_id') or entry.get("id"))
+                        retries[job['id']] = {"job": retry_job, "intended": intended, "date": today_str,
+                                              "next_at": time.time() + retry_delay(1)}
+                        error += f" (retry 1/{max_attempts} in {retry_delay(1):g}s)"
+                    else:
+                        finished[job['id']] = today_str
+                    record_fire(job, intended, status, actual=actual, error=error)
+
+                for r in retry_due:
+                    job = r["job"]
+                    error = results.get(job['id'])
+                    if not error:
+                        record_fire(job, r["intended"], "retried", actual=time.time())
+                    elif (job['attempt'] >= max_attempts or job['id'] in jobs_running
+                          or not retry_action(job, error, resolve_device(job) or {})
+                          or time.time() + retry_delay(job['attempt'] + 1) > r["intended"].timestamp() + retry_window):
+                        record_fire(job, r["intended"], "gave_up", actual=time.time(),
+                                    error=f"{error} after {job['attempt']} retries")
+                        logger.warning(f"Giving up on job {job['id']} ({job['action']} -> {job['device']}): {error}")
+                    else:
+                        job['attempt'] += 1
+                        job['action'] = retry_action(job, error, resolve_device(job) or {})
+                        r["next_at"] = time.time() + retry_delay(job['attempt'])
+                        continue
+                    finished[job['id']] = r["date"]
+                    del retries[job['id']]
+
+                # One transaction for the whole tick; rules still retrying are committed when they settle
+                if finished: store.set_last_run(finished)
+            # Only today's misses matter for de-duplication
+            missed_today.difference_update([k for k in missed_today if k[1] != today_str])
+
+        except Exception as e:
+            logger.error(f"Scheduler error: {e}")
+            count_error("scheduler", e)
+        # Wake early for the next retry
+        next_retry = min((r["next_at"] for r in retries.values()), default=time.time() + 30)
+        time.sleep(max(1, min(30, next_retry - time.time())))
 
-        except Exception as e: logger.error(f"Scheduler error: {e}")
-        time.sleep(30)
+# --- MULTI-AGENT ---
+# An agent is this same server started with AGENT_UPSTREAM set, on a host inside a VLAN the central
+# server can't reach. It scans and polls locally and pushes device deltas to the central server,
+# which merges them into its registry tagged with the agent's name. Control of those devices
+# (dashboard toggles, scheduled jobs) is sent back to the owning agent.
+agents = {}                         # central: agent name -> {"url", "last_report", "devices"}
+
+def agent_authorized():
+    """Agent endpoints are off unless AGENT_TOKEN is set, and then need the same token."""
+    supplied = request.headers.get("X-Agent-Token", "")
+    return bool(AGENT_TOKEN) and hmac.compare_digest(supplied, AGENT_TOKEN)
+
+def agent_control(agent, dev_id, action):
+    info = agents.get(agent)
+    if not info: raise RuntimeError(f"agent {agent} not connected")
+    import requests
+    r = requests.post(f"{info['url']}/api/agent/control", json={"id": dev_id, "action": action},
+                      headers={"X-Agent-Token": AGENT_TOKEN}, timeout=10)
+    r.raise_for_status()
+    return r.json()["state"]
+
+def merge_agent_report(report):
+    """Central side: folds one agent report into the registry. Returns False if a delta arrives from
+    an agent we don't know (e.g. after a restart), so it re-sends everything."""
+    agent = report["agent"]
+    if agent not in agents and not report.get("full"): return False
+    owned = {i for i, e in device_registry.items() if e.get("agent") == agent and not e.get("obj")}
+    seen = set()
+    for d in report.get("devices", []):
+        dev_id = d["id"]
+        seen.add(dev_id)
+        local = device_registry.get(dev_id)
+        if local and local.get("obj"): continue  # reachable from here too; the direct path wins
+        device_registry.upsert(dev_id, {"obj": None, "agent": agent, "name": d.get("name") or dev_id,
+                                        "ip": d.get("ip"), "mac": d.get("mac"), "serial": d.get("serial"),
+                                        "state": d.get("state", 0), "last_seen": time.time()})
+    gone = set(report.get("removed", []))
+    if report.get("full"): gone |= owned - seen
+    for dev_id in gone & owned: device_registry.remove(dev_id)
+    agents[agent] = {"url": report["url"], "last_report": time.time(),
+                     "devices": sum(1 for e in device_registry.values() if e.get("agent") == agent)}
+    return True
+
+def agent_self_url():
+    if AGENT_URL: return AGENT_URL
+    # The address this host uses to reach the central server is the one the server can reach back
+    host = urllib.parse.urlparse(AGENT_UPSTREAM).hostname
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect((host, 9))
+            return f"http://{s.getsockname()[0]}:{PORT}"
+    except OSError: return f"http://{socket.gethostname()}:{PORT}"
+
+def agent_push_loop():
+    """Agent side: sends changed devices every AGENT_PUSH_INTERVAL and a full snapshot every minute
+    (which also keeps the central server's last_seen fresh)."""
+    url = agent_self_url()
+    sent = {}
+    last_full = 0
+    import requests
+    session = requests.Session()
+    session.headers["X-Agent-Token"] = AGENT_TOKEN
+    while True:
+        current = {i: {"id": i, "name": e.get("name"), "ip": e.get("ip"), "mac": e.get("mac"),
+                       "serial": e.get("serial"), "state": e.get("state", 0)}
+                   for i, e in device_registry.items() if e.get("obj")}
+        full = time.time() - last_full >= 60
+        report = {"agent": AGENT_NAME, "url": url, "full": full,
+                  "devices": list(current.values()) if full else [d for i, d in current.items() if sent.get(i) != d],
+                  "removed": [i for i in sent if i not in current]}
+        if full or report["devices"] or report["removed"]:
+            try:
+                r = session.post(f"{AGENT_UPSTREAM}/api/agents/report", json=report, timeout=10)
+                r.raise_for_status()
+                if r.json().get("status") == "resync": last_full = 0
+                else:
+                    sent = current
+                    if full: last_full = time.time()
+            except Exception as e:
+                logger.warning(f"Agent push to {AGENT_UPSTREAM} failed: {e}")
+                count_error("agent", e)
+        time.sleep(AGENT_PUSH_INTERVAL)
 
 # --- ROUTES ---
 @app.route('/')
@@ -326,33 +1255,110 @@ def api_status():
     return jsonify({
         "status": "online",
         "scan_status": scan_status, 
+        "scan_progress": scan_progress,
+        "scan": scanner.get(),
         "device_count": len(device_registry),
+        "role": "agent" if AGENT_UPSTREAM else "server",
+        "uptime": round(time.time() - BOOT_TIME, 1),
+        "startup": startup,
         "version": VERSION
     })
 
+@app.route('/healthz')
+def healthz():
+    # Liveness only: touches no locks or devices, so a stuck scan can't fail the container health check
+    return Response("ok\n", mimetype="text/plain")
+
+@app.route('/metrics')
+def metrics():
+    return Response(METRICS.render(), content_type=METRICS_CONTENT_TYPE)
+
 @app.route('/api/devices')
 def api_devices():
     devs_out = []
-    for name, data in device_registry.items():
+    for dev_id, data in device_registry.items():
         devs_out.append({
-            "name": name, 
+            "id": dev_id,
+            "name": data.get("name"), 
             "ip": data.get("ip"), 
             "state": data.get("state", 0),
             "mac": data.get("mac"),
-            "serial": data.get("serial")
+            "serial": data.get("serial"),
+            "agent": data.get("agent"),
+            # Controllable now: a live object here, or via the owning agent
+            "ready": bool(data.get("obj") or data.get("agent")),
+            "restore": data.get("restore")
         })
     return jsonify(devs_out)
 
-@app.route('/api/toggle/<name>', methods=['POST'])
-def api_toggle(name):
-    entry = device_registry.get(name)
-    if entry and entry.get("obj"):
-        dev = entry["obj"]
+@app.route('/api/agents/report', methods=['POST'])
+def api_agent_report():
+    if not agent_authorized(): return jsonify({"status": "forbidden"}), 403
+    return jsonify({"status": "ok" if merge_agent_report(request.json) else "resync"})
+
+@app.route('/api/agents')
+def api_agents():
+    if not agent_authorized(): return jsonify({"status": "forbidden"}), 403
+    now = time.time()
+    return jsonify([{"name": n, "url": a["url"], "devices": a["devices"], "age": round(now - a["last_report"], 1)}
+                    for n, a in sorted(agents.items())])
+
+@app.route('/api/agent/control', methods=['POST'])
+def api_agent_control():
+    """Agent side: the central server relays a control command for one of our devices."""
+    if not agent_authorized(): return jsonify({"status": "forbidden"}), 403
+    data = request.json
+    entry = device_registry.get(data.get("id"))
+    if not entry or not entry.get("obj") or data.get("action") not in JOB_ACTIONS.values():
+        return jsonify({"status": "not found"}), 404
+    try: return jsonify({"status": "ok", "state": device_action(entry, data["action"])})
+    except Exception as e:
+        count_error("agent", e)
+        return jsonify({"status": "error", "error": str(e)}), 502
+
+@app.route('/api/history/<ref>')
+def api_history(ref):
+    now = time.time()
+    try:
+        until = float(request.args.get('until', now))
+        since = float(request.args.get('since', until - 86400))
+        points = max(1, min(int(request.args.get('points', 200)), 5000))
+    except ValueError:
+        return jsonify({"status": "bad request"}), 400
+    entry = device_registry.find(ref) or {"id": ref}
+    samples = history.query(entry["id"], since, until, store)
+    width, buckets = downsample(samples, since, until, points)
+    return jsonify({"device": entry.get("name", ref), "id": entry["id"], "since": since, "until": until, "bucket": width, "points": buckets})
+
+@app.route('/api/power/<ref>')
+def api_power(ref):
+    """Power curve for an Insight device. resolution=auto picks the finest rollup
+    that fits the range into `points` rows, so long ranges never touch raw samples."""
+    now = time.time()
+    try:
+        until = float(request.args.get('until', now))
+        since = float(request.args.get('since', until - 86400))
+        points = max(1, int(request.args.get('points', 500)))
+    except ValueError:
+        return jsonify({"status": "bad request"}), 400
+    res = request.args.get('resolution', 'auto')
+    if res == 'auto':
+        raw_step = max(2, int(settings.get("insight_interval", 10)))
+        res = next((r for r in RESOLUTIONS if (until - since) / (RESOLUTIONS[r][0] or raw_step) <= points), "day")
+    if res not in RESOLUTIONS:
+        return jsonify({"status": "bad request"}), 400
+    entry = device_registry.find(ref) or {}
+    name = entry.get("name", ref)
+    data = telemetry.query(device_key(name, entry.get("mac")), res, since, until)
+    return jsonify({"device": name, "resolution": res, "since": since, "until": until, **data})
+
+@app.route('/api/toggle/<ref>', methods=['POST'])
+def api_toggle(ref):
+    entry = device_registry.find(ref)
+    if entry and (entry.get("obj") or entry.get("agent")):
         def toggle_task():
-            try: 
-                dev.toggle()
-                entry['state'] = dev.get_state(force_update=True)
-            except: pass
+            try: device_action(entry, "toggle")
+            except Exception as e: count_error("toggle", e)
         threading.Thread(target=toggle_task).start()
         return jsonify({"status": "ok"})
     return jsonify({"status": "not found"}), 404
@@ -363,48 +1369,104 @@ def api_settings():
     if request.method == 'GET': return jsonify(settings)
     if request.method == 'POST':
         settings.update(request.json)
-        save_json(SETTINGS_FILE, settings)
+        store.update_settings(request.json)
         return jsonify({"status": "saved"})
 
 @app.route('/api/scan', methods=['POST'])
 def api_scan():
-    global scan_status
-    if scan_status != "Idle": 
-        return jsonify({"status": "busy"})
-    
-    # FIX: Target the single-run function, NOT the loop
-    threading.Thread(target=run_scan_cycle, daemon=True).start()
-    return jsonify({"status": "started"})
+    # Manual scans always sweep everything; concurrent clicks share one scan id
+    scan = scanner.request(full=True, source="api")
+    return jsonify({"status": "started" if scan["requests"] == 1 else "joined", "scan": scan})
+
+@app.route('/api/scan/<int:scan_id>')
+def api_scan_progress(scan_id):
+    scan = scanner.get(scan_id)
+    if not scan: return jsonify({"status": "not found"}), 404
+    return jsonify(scan)
+
+@app.route('/api/schedules/stats')
+def api_schedule_stats():
+    jobs = {}
+    for jid, st in list(schedule_stats.items()):
+        fired = st["on_time"] + st["late"] + st["failed"] + st["retried"] + st["gave_up"]
+        jobs[jid] = {**st, "avg_delay": round(st["total_delay"] / fired, 3) if fired else None}
+    pending = {jid: {"attempt": r["job"]["attempt"], "action": r["job"]["action"], "next_at": r["next_at"]}
+               for jid, r in list(retries.items())}
+    return jsonify({"grace_minutes": float(settings.get("schedule_grace_minutes", 0)),
+                    "jobs": jobs, "retrying": pending, "recent": list(schedule_events)})
 
 @app.route('/api/schedules', methods=['GET', 'POST', 'DELETE'])
 def api_schedules():
-    current = load_json(SCHEDULE_FILE, [])
-    if request.method == 'GET': return jsonify(current)
+    if request.method == 'GET': return jsonify(store.list_schedules())
     if request.method == 'POST':
         data = request.json
-        data['id'] = int(time.time())
+        data.pop('id', None)
         data['last_run'] = ""
-        current.append(data)
-        save_json(SCHEDULE_FILE, current)
-        return jsonify({"status": "added", "id": data['id']})
+        # Rules follow the device's stable id so renames and duplicate names don't break them
+        entry = device_registry.get(data.get('device_id')) or device_registry.find(data.get('device'))
+        if entry: data.update(device_id=entry["id"], device=entry.get("name"))
+        jid = store.add_schedule(data)
+        return jsonify({"status": "added", "id": jid})
     if request.method == 'DELETE':
         jid = int(request.args.get('id'))
-        new_list = [x for x in current if x['id'] != jid]
-        save_json(SCHEDULE_FILE, new_list)
+        store.delete_schedule(jid)
         return jsonify({"status": "deleted"})
 
 
+def warm_start():
+    """Everything __main__ doesn't need before the port is open: reloading history (before the
+    poller starts, so restored samples come first), importing pywemo, rebuilding the cached
+    devices (before the poller, which would otherwise re-probe them one by one), then the
+    poller and telemetry threads."""
+    if history.spill:
+        try: history.load(store, time.time() - 86400)
+        except Exception as e: logger.error(f"History reload failed: {e}")
+    startup_mark("history")
+    try: import pywemo
+    except Exception as e: logger.error(f"pywemo import failed: {e}")
+    startup_mark("pywemo")
+    try: restore_devices()
+    except Exception as e:
+        logger.error(f"Warm start restore failed: {e}")
+        count_error("restore", e)
+    startup_mark("restore")
+    threading.Thread(target=poller_loop, daemon=True).start()
+    threading.Thread(target=telemetry_loop, daemon=True).start()
+    startup["phase"] = "ready"
+    logger.info(f"Warm start finished in {startup['restore_ms']:.0f}ms")
+
+
 if __name__ == "__main__":
-    settings = load_json(SETTINGS_FILE, {})
+    # Frozen (PyInstaller) builds: lets spawned pool/poller workers run their target instead of the whole server
+    multiprocessing.freeze_support()
+    startup_mark("imports")
+    settings = store.get_settings()
+    history = StateHistory(size=int(settings.get("history_size", 2048)),
+                           interval=int(settings.get("history_interval", 60)),
+                           spill=bool(settings.get("history_spill", True)))
+    # The cached snapshot is served (obj=None, last known state) until the first scan reaches each device
+    load_device_cache()
+    startup_mark("cache")
     
-    # Start background threads
+    # Start background threads. Agents only discover, poll and report; rules run on the central server.
+    threading.Thread(target=warm_start, daemon=True).start()
     threading.Thread(target=scanner_loop, daemon=True).start()
-    threading.Thread(target=poller_loop, daemon=True).start()
-    threading.Thread(target=scheduler_loop, daemon=True).start()
+    if AGENT_UPSTREAM:
+        if not AGENT_TOKEN: logger.warning("AGENT_TOKEN is not set; the central server will reject reports")
+        threading.Thread(target=agent_push_loop, daemon=True).start()
+        logger.info(f"Agent mode: reporting to {AGENT_UPSTREAM} as {AGENT_NAME}")
+    else:
+        threading.Thread(target=scheduler_loop, daemon=True).start()
     
     print("----------------------------------------------------------------")
     print(f"   WEMO OPS SERVER - LISTENING ON PORT {PORT}")
     print("----------------------------------------------------------------")
+    startup_mark("listening")
+    if startup["phase"] == "starting": startup["phase"] = "warming"
     
     # Production-ready server
-    serve(app, host=HOST, port=PORT, threads=6)
\ No newline at end of file
+    try: serve(app, host=HOST, port=PORT, threads=6)
+    finally:
+        if history.spill: history.flush(store)
+        telemetry.flush()
+        if describer: describer.shutdown()
\ No newline at end of file
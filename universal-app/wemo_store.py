@@ -0,0 +1,324 @@
+"""Shared state store for Wemo Ops (server + desktop client).
+
+One SQLite database in WAL mode replaces the old whole-file schedules.json,
+settings.json and devices.json. Every process (server, desktop app) opens the
+same file; writes are row-level transactions and readers never block writers.
+Existing JSON files are imported once on first open and left in place.
+"""
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+
+DB_NAME = "wemo_ops.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS schedules (
+    id INTEGER PRIMARY KEY,
+    device TEXT NOT NULL,
+    data TEXT NOT NULL,
+    last_run TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_schedules_device ON schedules(device);
+CREATE TABLE IF NOT EXISTS devices (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    ip TEXT,
+    mac TEXT,
+    serial TEXT,
+    state INTEGER NOT NULL DEFAULT 0,
+    last_seen REAL NOT NULL DEFAULT 0,
+    data TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS idx_devices_mac ON devices(mac);
+CREATE INDEX IF NOT EXISTS idx_devices_ip ON devices(ip);
+CREATE TABLE IF NOT EXISTS device_state (
+    id TEXT PRIMARY KEY,
+    state INTEGER,
+    latency REAL,
+    polled REAL NOT NULL,
+    shard INTEGER,
+    seq INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_device_state_polled ON device_state(polled);
+CREATE INDEX IF NOT EXISTS idx_device_state_seq ON device_state(seq);
+CREATE TABLE IF NOT EXISTS history (
+    device TEXT NOT NULL,
+    ts REAL NOT NULL,
+    state INTEGER,
+    latency REAL
+);
+CREATE INDEX IF NOT EXISTS idx_history_device_ts ON history(device, ts);
+CREATE INDEX IF NOT EXISTS idx_history_ts ON history(ts);
+CREATE TABLE IF NOT EXISTS documents (
+    hash TEXT PRIMARY KEY,
+    xml BLOB NOT NULL
+);
+"""
+
+DEVICE_COLUMNS = ("name", "ip", "mac", "serial", "state", "last_seen")
+
+
+def device_id(mac=None, udn=None, name=None):
+    """Stable identity for a device: its MAC as 12 hex digits, else its UDN, else the friendly name."""
+    if mac:
+        digits = re.sub(r"[^0-9A-Fa-f]", "", str(mac)).upper()
+        if len(digits) == 12: return digits
+    return udn or name
+
+
+class StateStore:
+    def __init__(self, data_dir, db_name=DB_NAME):
+        self.data_dir = data_dir
+        self.path = os.path.join(data_dir, db_name)
+        self._local = threading.local()
+        self._upgrade_devices_table()
+        self._migrate_json()
+
+    # --- CONNECTIONS ---
+    def _conn(self):
+        # sqlite3 connections are per-thread; each thread gets its own
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("PRAGMA busy_timeout=10000")
+            self._local.db = db
+        return db
+
+    def _upgrade_devices_table(self):
+        """Applies the schema; a devices table from before ids were added is re-keyed by device_id()."""
+        db = self._conn()
+        cols = [r[1] for r in db.execute("PRAGMA table_info(devices)")]
+        legacy = bool(cols) and "id" not in cols
+        # device_state from before publish sequence numbers: add the column before its index is created
+        state_cols = [r[1] for r in db.execute("PRAGMA table_info(device_state)")]
+        if state_cols and "seq" not in state_cols:
+            db.execute("ALTER TABLE device_state ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+        if legacy:
+            db.execute("ALTER TABLE devices RENAME TO devices_v1")
+            db.execute("DROP INDEX IF EXISTS idx_devices_mac")
+            db.execute("DROP INDEX IF EXISTS idx_devices_ip")
+        db.executescript(SCHEMA)
+        if legacy:
+            with self.transaction() as tx:
+                rows = {r["name"]: dict(r) for r in tx.execute("SELECT * FROM devices_v1")}
+                for entry in rows.values(): entry.update(json.loads(entry.pop("data") or "{}"))
+                self._replace_devices(tx, rows, keyed_by_name=True)
+                tx.execute("DROP TABLE devices_v1")
+
+    def transaction(self):
+        return _Transaction(self._conn())
+
+    def data_version(self):
+        """Changes whenever ANOTHER connection (thread or process) commits."""
+        return self._conn().execute("PRAGMA data_version").fetchone()[0]
+
+    # --- SETTINGS ---
+    def get_settings(self):
+        rows = self._conn().execute("SELECT key, value FROM settings").fetchall()
+        return {r["key"]: json.loads(r["value"]) for r in rows}
+
+    def update_settings(self, values):
+        with self.transaction() as db:
+            self._upsert_settings(db, values)
+
+    def _upsert_settings(self, db, values):
+        db.executemany(
+            "INSERT INTO settings(key, value) VALUES(?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+            [(k, json.dumps(v)) for k, v in values.items()])
+
+    # --- SCHEDULES ---
+    def list_schedules(self):
+        rows = self._conn().execute("SELECT id, data, last_run FROM schedules ORDER BY id").fetchall()
+        jobs = []
+        for r in rows:
+            job = json.loads(r["data"])
+            job["id"] = r["id"]
+            job["last_run"] = r["last_run"]
+            jobs.append(job)
+        return jobs
+
+    def add_schedule(self, job):
+        with self.transaction() as db:
+            return self._insert_schedule(db, job)
+
+    def _insert_schedule(self, db, job):
+        job = dict(job)
+        jid = job.pop("id", None)
+        last_run = job.pop("last_run", "") or ""
+        if jid is None:
+            jid = int(time.time())
+        # Ids are creation timestamps; bump on collision (two rules in the same second)
+        while db.execute("SELECT 1 FROM schedules WHERE id=?", (jid,)).fetchone():
+            jid += 1
+        db.execute("INSERT INTO schedules(id, device, data, last_run) VALUES(?, ?, ?, ?)",
+                   (jid, job.get("device", ""), json.dumps(job), last_run))
+        return jid
+
+    def update_schedule(self, jid, fields):
+        """Merges fields into a stored rule (e.g. device_id, or the device's current name)."""
+        with self.transaction() as db:
+            row = db.execute("SELECT data FROM schedules WHERE id=?", (jid,)).fetchone()
+            if not row: return
+            job = json.loads(row["data"])
+            job.update({k: v for k, v in fields.items() if k not in ("id", "last_run")})
+            db.execute("UPDATE schedules SET device=?, data=? WHERE id=?", (job.get("device", ""), json.dumps(job), jid))
+
+    def delete_schedule(self, jid):
+        with self.transaction() as db:
+            db.execute("DELETE FROM schedules WHERE id=?", (jid,))
+
+    def set_last_run(self, updates):
+        """updates: {job_id: last_run} committed in one transaction."""
+        with self.transaction() as db:
+            db.executemany("UPDATE schedules SET last_run=? WHERE id=?",
+                           [(v, k) for k, v in updates.items()])
+
+    # --- DEVICES ---
+    def list_devices(self):
+        """{device id: entry}; each entry carries its friendly name."""
+        rows = self._conn().execute("SELECT * FROM devices").fetchall()
+        out = {}
+        for r in rows:
+            entry = json.loads(r["data"] or "{}")
+            entry.update({c: r[c] for c in DEVICE_COLUMNS})
+            out[r["id"]] = entry
+        return out
+
+    def save_devices(self, devices):
+        """Replaces the device table with {device id: entry} in one transaction."""
+        with self.transaction() as db:
+            self._replace_devices(db, devices)
+
+    def _replace_devices(self, db, devices, keyed_by_name=False):
+        # Old devices.json files and pre-id tables are keyed by friendly name
+        rows = {}
+        for key, d in devices.items():
+            name = key if keyed_by_name else d.get("name", key)
+            dev_id = device_id(d.get("mac"), d.get("udn"), name) if keyed_by_name else key
+            extra = {k: v for k, v in d.items() if k not in DEVICE_COLUMNS and k != "obj"}
+            rows[dev_id] = (dev_id, name, d.get("ip"), d.get("mac"), d.get("serial"),
+                            int(d.get("state") or 0), float(d.get("last_seen") or 0), json.dumps(extra))
+        db.execute("DELETE FROM devices")
+        db.executemany("INSERT INTO devices(id, name, ip, mac, serial, state, last_seen, data) "
+                       "VALUES(?, ?, ?, ?, ?, ?, ?, ?)", list(rows.values()))
+
+    def update_device_state(self, dev_id, state, last_seen):
+        with self.transaction() as db:
+            db.execute("UPDATE devices SET state=?, last_seen=? WHERE id=?", (int(state or 0), last_seen, dev_id))
+
+    # --- POLLED STATE (sharded poller workers, see wemo_poller.py) ---
+    def publish_states(self, rows):
+        """rows: (id, state or None if unreachable, latency, polled ts, shard). Each row gets the next
+        publish sequence number; the write lock makes them increase across all worker processes."""
+        with self.transaction() as db:
+            base = db.execute("SELECT COALESCE(MAX(seq), 0) FROM device_state").fetchone()[0]
+            db.executemany("INSERT INTO device_state(id, state, latency, polled, shard, seq) VALUES(?, ?, ?, ?, ?, ?) "
+                           "ON CONFLICT(id) DO UPDATE SET state=excluded.state, latency=excluded.latency, "
+                           "polled=excluded.polled, shard=excluded.shard, seq=excluded.seq",
+                           [tuple(row) + (base + i + 1,) for i, row in enumerate(rows)])
+
+    def device_states(self, after=0):
+        """Rows published after sequence number `after`: [(id, state, latency, polled, seq)] in publish order.
+        (Not by polled time: a worker publishes a whole cycle at once, stamped with each device's poll time.)"""
+        return [tuple(r) for r in self._conn().execute(
+            "SELECT id, state, latency, polled, seq FROM device_state WHERE seq > ? ORDER BY seq", (after,))]
+
+    def state_seq(self):
+        """Newest publish sequence number (the cursor to start reading device_states from)."""
+        return self._conn().execute("SELECT COALESCE(MAX(seq), 0) FROM device_state").fetchone()[0]
+
+    # --- DEVICE DESCRIPTIONS (SCPD documents by hash, see wemo_describe.py) ---
+    def save_documents(self, docs):
+        """docs: {hash: xml bytes}; documents already stored are left as they are."""
+        with self.transaction() as db:
+            db.executemany("INSERT OR IGNORE INTO documents(hash, xml) VALUES(?, ?)", list(docs.items()))
+
+    def get_documents(self, hashes):
+        hashes = list(set(hashes))
+        if not hashes: return {}
+        marks = ",".join("?" * len(hashes))
+        return {r["hash"]: bytes(r["xml"]) for r in self._conn().execute(
+            f"SELECT hash, xml FROM documents WHERE hash IN ({marks})", hashes)}
+
+    # --- HISTORY ---
+    def add_history(self, rows):
+        """rows: iterable of (device, ts, state, latency)."""
+        with self.transaction() as db:
+            db.executemany("INSERT INTO history(device, ts, state, latency) VALUES(?, ?, ?, ?)", rows)
+
+    def get_history(self, device, since=0, until=None):
+        if until is None: until = time.time()
+        return [tuple(r) for r in self._conn().execute(
+            "SELECT ts, state, latency FROM history WHERE device=? AND ts BETWEEN ? AND ? ORDER BY ts",
+            (device, since, until))]
+
+    def recent_history(self, since):
+        return [tuple(r) for r in self._conn().execute(
+            "SELECT device, ts, state, latency FROM history WHERE ts >= ? ORDER BY ts", (since,))]
+
+    def trim_history(self, older_than):
+        with self.transaction() as db:
+            db.execute("DELETE FROM history WHERE ts < ?", (older_than,))
+
+    # --- ONE-TIME JSON IMPORT ---
+    def _migrate_json(self):
+        def read(name, default):
+            path = os.path.join(self.data_dir, name)
+            try:
+                with open(path, 'r') as f: return json.load(f)
+            except: return default
+
+        # Check and import under one write lock so two processes starting together can't both import
+        with self.transaction() as db:
+            if db.execute("SELECT 1 FROM meta WHERE key='json_imported'").fetchone():
+                return
+            settings = read("settings.json", {})
+            schedules = read("schedules.json", [])
+            devices = read("devices.json", {})
+            if isinstance(settings, dict) and settings: self._upsert_settings(db, settings)
+            if isinstance(schedules, list):
+                for job in schedules:
+                    if isinstance(job, dict): self._insert_schedule(db, job)
+            if isinstance(devices, dict) and devices: self._replace_devices(db, devices, keyed_by_name=True)
+            db.execute("INSERT OR REPLACE INTO meta(key, value) VALUES('json_imported', ?)", (str(time.time()),))
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK around a block; takes the write lock up front."""
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None: self.db.execute("COMMIT")
+        else: self.db.execute("ROLLBACK")
+        return False
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_store(data_dir):
+    """One StateStore per data directory per process."""
+    with _stores_lock:
+        if data_dir not in _stores:
+            _stores[data_dir] = StateStore(data_dir)
+        return _stores[data_dir]
@@ -0,0 +1,204 @@
+"""Insight energy telemetry storage for Wemo Ops Server.
+
+Samples live in append-only column files, one directory per device,
+resolution and time bucket:
+
+    telemetry/<device>/raw/2026-10-19/{ts,watts,kwh}.col
+    telemetry/<device>/minute/2026-10/{ts,avg,min,max,kwh,n}.col
+    telemetry/<device>/hour/2026/...
+    telemetry/<device>/day/all/...
+
+Each .col file is a packed array of a single fixed-width type, so a power
+curve only reads the columns and buckets it needs. Minute/hour/day rollups
+are built while collecting, never by rescanning raw samples.
+"""
+import os
+import re
+import time
+import shutil
+import datetime
+import threading
+from array import array
+
+RAW_COLUMNS = (("ts", "d"), ("watts", "f"), ("kwh", "f"))
+ROLLUP_COLUMNS = (("ts", "d"), ("avg", "f"), ("min", "f"), ("max", "f"), ("kwh", "f"), ("n", "I"))
+
+# resolution -> (window seconds, bucket directory format)
+RESOLUTIONS = {
+    "raw": (0, "%Y-%m-%d"),
+    "minute": (60, "%Y-%m"),
+    "hour": (3600, "%Y"),
+    "day": (86400, None),
+}
+ROLLUPS = ("minute", "hour", "day")
+
+# Days of each resolution to keep (None = forever)
+DEFAULT_RETENTION = {"raw": 7, "minute": 90, "hour": 730, "day": None}
+
+
+def device_key(name, mac=None):
+    """Directory name for a device; the MAC survives renames, the name is the fallback."""
+    key = mac if mac and mac != "Unknown" else name
+    return re.sub(r"[^A-Za-z0-9_-]", "_", str(key))
+
+
+def window_start(res, ts):
+    if res == "minute": return ts - ts % 60
+    # Hours and days follow local time so a day lines up with the Insight's own today_kwh reset
+    dt = datetime.datetime.fromtimestamp(ts)
+    if res == "hour": return dt.replace(minute=0, second=0, microsecond=0).timestamp()
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+
+def bucket_name(res, ts):
+    fmt = RESOLUTIONS[res][1]
+    return datetime.datetime.fromtimestamp(ts).strftime(fmt) if fmt else "all"
+
+
+def bucket_bounds(res, name):
+    """(start, end) timestamps covered by a bucket directory, used to skip buckets outside a query."""
+    if name == "all": return 0, float("inf")
+    try: start = datetime.datetime.strptime(name, RESOLUTIONS[res][1])
+    except ValueError: return None
+    if res == "raw": end = start + datetime.timedelta(days=1)
+    elif res == "minute": end = (start.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+    else: end = start.replace(year=start.year + 1)
+    return start.timestamp(), end.timestamp()
+
+
+class TelemetryStore:
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+
+    def _columns(self, res):
+        return RAW_COLUMNS if res == "raw" else ROLLUP_COLUMNS
+
+    def append(self, key, res, rows):
+        """rows: tuples in column order, appended to the bucket each row's timestamp falls in."""
+        buckets = {}
+        for row in rows: buckets.setdefault(bucket_name(res, row[0]), []).append(row)
+        with self.lock:
+            for bucket, group in buckets.items():
+                path = os.path.join(self.root, key, res, bucket)
+                os.makedirs(path, exist_ok=True)
+                for i, (col, typecode) in enumerate(self._columns(res)):
+                    with open(os.path.join(path, col + ".col"), "ab") as f:
+                        array(typecode, [r[i] for r in group]).tofile(f)
+
+    def read(self, key, res, since, until, columns=None):
+        """Returns {column: [values]} for rows with since <= ts <= until."""
+        cols = [c for c in self._columns(res) if columns is None or c[0] in columns or c[0] == "ts"]
+        out = {c: [] for c, _ in cols}
+        base = os.path.join(self.root, key, res)
+        try: buckets = sorted(os.listdir(base))
+        except OSError: return out
+        for bucket in buckets:
+            bounds = bucket_bounds(res, bucket)
+            if not bounds or bounds[1] < since or bounds[0] > until: continue
+            data = {}
+            for col, typecode in cols:
+                arr = array(typecode)
+                try:
+                    with open(os.path.join(base, bucket, col + ".col"), "rb") as f: raw = f.read()
+                    arr.frombytes(raw[:len(raw) - len(raw) % arr.itemsize])
+                except OSError: pass
+                data[col] = arr
+            # A crash mid-append can leave columns of unequal length; only whole rows count
+            rows = min(len(a) for a in data.values())
+            ts = data["ts"]
+            for i in range(rows):
+                if since <= ts[i] <= until:
+                    for col in data: out[col].append(data[col][i])
+        return out
+
+    def prune(self, retention=DEFAULT_RETENTION, now=None):
+        now = now or time.time()
+        with self.lock:
+            try: keys = os.listdir(self.root)
+            except OSError: return
+            for key in keys:
+                for res, days in retention.items():
+                    if days is None: continue
+                    base = os.path.join(self.root, key, res)
+                    try: buckets = os.listdir(base)
+                    except OSError: continue
+                    for bucket in buckets:
+                        bounds = bucket_bounds(res, bucket)
+                        if bounds and bounds[1] < now - days * 86400:
+                            shutil.rmtree(os.path.join(base, bucket), ignore_errors=True)
+
+
+class _Window:
+    __slots__ = ("start", "total", "n", "lo", "hi", "kwh")
+
+    def __init__(self, start):
+        self.start, self.total, self.n, self.lo, self.hi, self.kwh = start, 0.0, 0, float("inf"), float("-inf"), 0.0
+
+    def add(self, total, n, lo, hi, kwh):
+        self.total += total; self.n += n
+        self.lo = min(self.lo, lo); self.hi = max(self.hi, hi)
+        self.kwh = kwh
+
+    def row(self):
+        return (self.start, self.total / self.n, self.lo, self.hi, self.kwh, self.n)
+
+
+class InsightCollector:
+    """Buffers raw samples and open rollup windows per device; flush() writes them out."""
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.Lock()
+        self.windows = {}   # key -> {res: _Window}
+        self.pending = {}   # (key, res) -> [rows]
+
+    def add_sample(self, key, ts, watts, kwh):
+        with self.lock:
+            self.pending.setdefault((key, "raw"), []).append((ts, watts, kwh))
+            self._roll(key, ts, 0, (watts, 1, watts, watts, kwh))
+
+    def _roll(self, key, ts, level, values):
+        """Adds values to the open window at ROLLUPS[level], closing it (and cascading up) when ts leaves it."""
+        if level >= len(ROLLUPS): return
+        res = ROLLUPS[level]
+        windows = self.windows.setdefault(key, {})
+        start = window_start(res, ts)
+        win = windows.get(res)
+        if win and win.start != start:
+            row = win.row()
+            self.pending.setdefault((key, res), []).append(row)
+            self._roll(key, win.start, level + 1, (win.total, win.n, win.lo, win.hi, win.kwh))
+            win = None
+        if win is None: win = windows[res] = _Window(start)
+        win.add(*values)
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for (key, res), rows in pending.items():
+            self.store.append(key, res, rows)
+
+    def query(self, key, res, since, until):
+        """Stored rows plus anything not yet flushed, as columns. Rollups end with a partial row for the
+        current window that includes the still-open finer windows (e.g. today's day row counts the
+        current hour and minute)."""
+        out = self.store.read(key, res, since, until)
+        names = [c for c, _ in (RAW_COLUMNS if res == "raw" else ROLLUP_COLUMNS)]
+        with self.lock:
+            extra = list(self.pending.get((key, res), []))
+            if res in ROLLUPS:
+                windows = self.windows.get(key, {})
+                partial = {}
+                # Coarsest first so kwh ends up as the newest reading. An open minute can already
+                # belong to the next hour/day, whose own window isn't open yet.
+                for level in range(ROLLUPS.index(res), -1, -1):
+                    win = windows.get(ROLLUPS[level])
+                    if not win or not win.n: continue
+                    start = window_start(res, win.start)
+                    if start not in partial: partial[start] = _Window(start)
+                    partial[start].add(win.total, win.n, win.lo, win.hi, win.kwh)
+                extra.extend(partial[start].row() for start in sorted(partial))
+        for row in extra:
+            if since <= row[0] <= until:
+                for i, col in enumerate(names): out[col].append(row[i])
+        return out
@@ -27,7 +27,7 @@ pip3 install flask waitress schedule requests ifaddr --target $BUILD_DIR/opt/Wem
 
 # 2. Copy Application Files
 echo "--- Copying application files ---"
-cp wemo_server.py $BUILD_DIR/opt/WemoOpsServer/
+cp wemo_server.py wemo_files.py $BUILD_DIR/opt/WemoOpsServer/
 # If you have templates (HTML) or static files, uncomment these:
 # cp -r templates $BUILD_DIR/opt/WemoOpsServer/
 # cp -r static $BUILD_DIR/opt/WemoOpsServer/
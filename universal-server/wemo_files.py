@@ -0,0 +1,39 @@
+"""Shared file helpers: crash-safe JSON saves."""
+import os
+import json
+import shutil
+
+# --- SAFE PERSISTENCE ---
+def write_json_atomic(path, data, **dump_args):
+    """Temp file + fsync + rename, so a crash never leaves a truncated file. The previous version is kept as <path>.bak."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(data, f, **dump_args)
+        f.flush()
+        os.fsync(f.fileno())
+    if os.path.exists(path):
+        bak = path + ".bak"
+        try:
+            if os.path.exists(bak): os.remove(bak)
+            os.link(path, bak)  # hard link: no extra data written
+        except OSError:
+            try: shutil.copy2(path, bak)
+            except: pass
+    os.replace(tmp, path)
+    if os.name != 'nt':
+        try:
+            fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+            try: os.fsync(fd)
+            finally: os.close(fd)
+        except: pass
+
+def load_json(path, default_type=dict):
+    """Reads path, falling back to the .bak copy if it's missing or corrupt; default_type() if neither is usable."""
+    for p in (path, path + ".bak"):
+        if os.path.exists(p):
+            try:
+                with open(p) as f:
+                    data = json.load(f)
+                    if isinstance(data, default_type): return data
+            except: pass
+    return default_type()
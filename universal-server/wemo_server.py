@@ -1,6 +1,5 @@
 import os
 import sys
-import json
 import time
 import threading
 import datetime
@@ -10,6 +9,7 @@ import ipaddress
 import concurrent.futures
 import requests
 from flask import Flask, render_template_string, jsonify, request
+from wemo_files import write_json_atomic, load_json
 
 # --- CONFIGURATION ---
 VERSION = "v1.0.2"
@@ -44,21 +44,14 @@ app = Flask(__name__)
 # --- GLOBAL STATE ---
 known_devices = {}
 scan_status = "Idle"
+scan_id = 0                         # Bumped at the start of every sweep
+scan_request = threading.Event()    # Wakes scanner_loop early; set during a sweep = one follow-up sweep
 settings = {}
 solar_times = {}
 
 # --- UTILS ---
-def load_json(path, default=None):
-    if default is None: default = {}
-    if os.path.exists(path):
-        try:
-            with open(path, 'r') as f: return json.load(f)
-        except: pass
-    return default
-
 def save_json(path, data):
-    try:
-        with open(path, 'w') as f: json.dump(data, f, indent=2)
+    try: write_json_atomic(path, data, indent=2)
     except Exception as e:
         logger.error(f"Failed to save JSON: {e}")
 
@@ -142,10 +135,13 @@ class DeepScanner:
 
 # --- BACKGROUND TASKS ---
 def scanner_loop():
-    global scan_status
+    """The only scanning thread; manual scans wake it instead of starting another one."""
+    global scan_status, scan_id
     import pywemo
     ds = DeepScanner()
     while True:
+        scan_request.clear()
+        scan_id += 1
         try:
             scan_status = "Scanning (SSDP)..."
             devices = pywemo.discover_devices()
@@ -162,7 +158,7 @@ def scanner_loop():
         except Exception as e:
             logger.error(f"Scan error: {e}")
             scan_status = "Error"
-        time.sleep(SCAN_INTERVAL)
+        scan_request.wait(SCAN_INTERVAL)
 
 def scheduler_loop():
     while True:
@@ -173,7 +169,8 @@ def scheduler_loop():
             current_hhmm = now.strftime("%H:%M")
             solar = get_solar_times()
             
-            current_schedules = load_json(SCHEDULE_FILE, [])
+            current_schedules = load_json(SCHEDULE_FILE, list)
+            schedule_modified = False
             
             for job in current_schedules:
                 if weekday not in job.get('days', []): continue
@@ -198,7 +195,8 @@ def scheduler_loop():
                             elif job['action'] == "Toggle": dev.toggle()
                         except: pass
                     job['last_run'] = today_str
-                    save_json(SCHEDULE_FILE, current_schedules)
+                    schedule_modified = True
+            if schedule_modified: save_json(SCHEDULE_FILE, current_schedules)
         except Exception as e: logger.error(f"Scheduler error: {e}")
         time.sleep(30)
 
@@ -208,12 +206,13 @@ def index(): return render_template_string(HTML_TEMPLATE, version=VERSION)
 
 @app.route('/api/status')
 def api_status():
-    return jsonify({"scan_status": scan_status, "device_count": len(known_devices)})
+    return jsonify({"scan_status": scan_status, "scan_id": scan_id, "device_count": len(known_devices)})
 
 @app.route('/api/devices')
 def api_devices():
     devs_out = []
-    for name, dev in known_devices.items():
+    # Snapshot: scanner_loop adds devices while we iterate
+    for name, dev in list(known_devices.items()):
         try: state = dev.get_state()
         except: state = 0
         devs_out.append({"name": name, "ip": dev.host, "state": state})
@@ -238,15 +237,14 @@ def api_settings():
 
 @app.route('/api/scan', methods=['POST'])
 def api_scan():
-    global scan_status
-    if "Scanning" in scan_status: return jsonify({"status": "busy"})
-    scan_status = "Starting..."
-    threading.Thread(target=scanner_loop, daemon=True).start()
-    return jsonify({"status": "started"})
+    # Requests during a sweep coalesce into a single follow-up sweep (scan_id + 1)
+    busy = "Scanning" in scan_status
+    scan_request.set()
+    return jsonify({"status": "queued" if busy else "started", "scan_id": scan_id + 1})
 
 @app.route('/api/schedules', methods=['GET', 'POST', 'DELETE'])
 def api_schedules():
-    current = load_json(SCHEDULE_FILE, [])
+    current = load_json(SCHEDULE_FILE, list)
     if request.method == 'GET': return jsonify(current)
     if request.method == 'POST':
         data = request.json
@@ -521,7 +519,7 @@ HTML_TEMPLATE = """
 """
 
 # --- STARTUP ---
-settings = load_json(SETTINGS_FILE, {})
+settings = load_json(SETTINGS_FILE, dict)
 
 def _start_background():
     threading.Thread(target=scanner_loop, daemon=True).start()
@@ -4,7 +4,6 @@ import threading
 import sys
 import os
 import time
-import json
 import requests
 import datetime
 import socket
@@ -15,6 +14,7 @@ import webbrowser
 import re
 from tkinter import messagebox
 import pyperclip
+from wemo_files import write_json_atomic, load_json, ConfigWatcher
 
 # --- CONFIGURATION ---
 VERSION = "v4.2.6"
@@ -38,6 +38,7 @@ if not os.path.exists(APP_DATA_DIR):
 PROFILE_FILE = os.path.join(APP_DATA_DIR, "wifi_profiles.json")
 SCHEDULE_FILE = os.path.join(APP_DATA_DIR, "schedules.json")
 SETTINGS_FILE = os.path.join(APP_DATA_DIR, "settings.json")
+PROVISION_CACHE_FILE = os.path.join(APP_DATA_DIR, "provision_methods.json")
 
 # --- SMART SERVICE PATH DETECTION ---
 if sys.platform == "win32":
@@ -171,6 +172,81 @@ class NetworkUtils:
             print(f"Wifi Scan Error: {e}")
         return [ssid for ssid in list(set(wemos)) if "wemo" in ssid.lower() or "belkin" in ssid.lower()]
 
+    @staticmethod
+    def probe_setup_network(target_ips, target_ports):
+        # One concurrent probe of every IP/port candidate; the first device to answer wins
+        pairs = [(ip, port) for ip in target_ips for port in target_ports]
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(pairs))
+        try:
+            futures = {}
+            for ip, port in pairs:
+                check_url = f"http://{ip}:{port}/setup.xml"
+                futures[executor.submit(pywemo.discovery.device_from_description, check_url)] = (ip, port)
+            for future in concurrent.futures.as_completed(futures):
+                try: dev = future.result()
+                except: dev = None
+                if dev:
+                    ip, port = futures[future]
+                    return dev, ip, port
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return None, None, None
+
+# ==============================================================================
+#  NETWORK WATCHER
+# ==============================================================================
+class NetworkWatcher:
+    """Blocks until the host's interfaces, addresses or routes change.
+    Uses a netlink route socket on Linux; elsewhere compares a cheap snapshot of local addresses."""
+    RTMGRP_LINK = 0x1
+    RTMGRP_IPV4_IFADDR = 0x10
+    RTMGRP_IPV4_ROUTE = 0x40
+
+    def __init__(self, poll_interval=2):
+        self.poll_interval = poll_interval
+        self.sock = None
+        if sys.platform.startswith("linux"):
+            try:
+                self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+                self.sock.bind((0, self.RTMGRP_LINK | self.RTMGRP_IPV4_IFADDR | self.RTMGRP_IPV4_ROUTE))
+            except:
+                self.sock = None
+        self.last_snapshot = self._snapshot()
+
+    def _snapshot(self):
+        try:
+            import ifaddr
+            return sorted((a.nice_name, str(ip.ip)) for a in ifaddr.get_adapters() for ip in a.ips)
+        except:
+            return NetworkUtils.get_local_ip()
+
+    def wait_for_change(self, timeout):
+        """Returns True if addressing changed within timeout seconds, False otherwise."""
+        if self.sock:
+            try:
+                self.sock.settimeout(timeout)
+                self.sock.recv(65535)
+                # DHCP/link-up produces a burst of messages; drain it so we only react once
+                self.sock.settimeout(0.5)
+                try:
+                    while True: self.sock.recv(65535)
+                except socket.timeout: pass
+                return True
+            except socket.timeout:
+                return False
+            except OSError:
+                self.sock = None
+
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0: return False
+            time.sleep(min(self.poll_interval, remaining))
+            snap = self._snapshot()
+            if snap != self.last_snapshot:
+                self.last_snapshot = snap
+                return True
+
 # ==============================================================================
 #  SERVICE MANAGER
 # ==============================================================================
@@ -312,7 +388,7 @@ class WemoOpsApp(ctk.CTk):
         self.grid_columnconfigure(1, weight=1)
         self.grid_rowconfigure(0, weight=1)
 
-        self.settings = self.load_json(SETTINGS_FILE, dict)
+        self.settings = load_json(SETTINGS_FILE, dict)
         
         theme = self.settings.get("theme", "System")
         scale = self.settings.get("scale", "100%")
@@ -323,8 +399,8 @@ class WemoOpsApp(ctk.CTk):
         self.current_setup_port = None 
         self.manual_override_active = False 
         
-        self.profiles = self.load_json(PROFILE_FILE, dict)
-        self.schedules = self.load_json(SCHEDULE_FILE, list) or []
+        self.profiles = load_json(PROFILE_FILE, dict)
+        self.schedules = load_json(SCHEDULE_FILE, list) or []
         self.saved_subnets = self.settings.get("subnets", [])
         
         self.known_devices_map = {} 
@@ -768,14 +844,33 @@ class WemoOpsApp(ctk.CTk):
     def _brute_force_provision(self, dev, ssid, pwd):
         enc_modes = [2, 1, 0]
         len_opts = [True, False]
-        for mode in enc_modes:
-            for length in len_opts:
-                try:
-                    self.log_prov(f"Attempting: Method {mode}, Len={length}...")
-                    dev.setup(ssid=ssid, password=pwd, _encrypt_method=mode, _add_password_lengths=length)
-                    self.log_prov(f"  > Accepted!")
-                    return
+        attempts = [(mode, length) for mode in enc_modes for length in len_opts]
+
+        # Learned cache: try whatever last worked for this model + firmware first
+        cache_key = f"{getattr(dev, 'model_name', '?')}|{getattr(dev, 'firmware_version', '?')}"
+        method_cache = load_json(PROVISION_CACHE_FILE, dict)
+        known = method_cache.get(cache_key)
+        if known and (known.get("method"), known.get("lengths")) in attempts:
+            attempts.remove((known["method"], known["lengths"]))
+            attempts.insert(0, (known["method"], known["lengths"]))
+            self.log_prov(f"Using learned method for {cache_key}")
+
+        for mode, length in attempts:
+            try:
+                self.log_prov(f"Attempting: Method {mode}, Len={length}...")
+                dev.setup(ssid=ssid, password=pwd, _encrypt_method=mode, _add_password_lengths=length)
+                self.log_prov(f"  > Accepted!")
+                same = known and known.get("method") == mode and known.get("lengths") == length
+                method_cache[cache_key] = {
+                    "method": mode,
+                    "lengths": length,
+                    "successes": known.get("successes", 0) + 1 if same else 1,
+                    "last_used": datetime.date.today().isoformat()
+                }
+                try: self.save_json(PROVISION_CACHE_FILE, method_cache)
                 except: pass
+                return
+            except: pass
         raise Exception("All provisioning attempts failed.")
 
     # --- MAINTENANCE (FIXED) ---
@@ -991,6 +1086,7 @@ class WemoOpsApp(ctk.CTk):
             self.sched_dev_combo.set(names[0])
 
     def _scheduler_engine(self):
+        watcher = ConfigWatcher(APP_DATA_DIR, [os.path.basename(SCHEDULE_FILE)])
         while True:
             try:
                 now = datetime.datetime.now()
@@ -1015,7 +1111,11 @@ class WemoOpsApp(ctk.CTk):
                         job['last_run'] = today_str
                         self.save_json(SCHEDULE_FILE, self.schedules)
             except: pass
-            time.sleep(30)
+            # Pick up rules edited by the tray service as soon as the file changes
+            if watcher.wait_for_change(30):
+                self.schedules = load_json(SCHEDULE_FILE, list)
+                if self.frames["sched"].winfo_ismapped():
+                    self.after(0, self.render_jobs)
 
     def execute_job(self, job):
         dev_name = job['device']
@@ -1034,15 +1134,8 @@ class WemoOpsApp(ctk.CTk):
             except: pass
 
     # --- UTILS & SCANNER ---
-    def load_json(self, path, default_type=dict):
-        if os.path.exists(path):
-            try:
-                with open(path) as f: return json.load(f)
-            except: pass
-        return default_type()
-
     def save_json(self, path, data):
-        with open(path, 'w') as f: json.dump(data, f)
+        write_json_atomic(path, data)
 
     def save_current_profile(self):
         ssid = self.ssid_entry.get()
@@ -1090,36 +1183,36 @@ class WemoOpsApp(ctk.CTk):
         self.prov_log.insert("end", f"{msg}\n")
         self.prov_log.see("end")
 
-    # --- RESTORED CONNECTION MONITOR (Scanning Ports) ---
+    # --- CONNECTION MONITOR (Event Driven) ---
     def _connection_monitor(self):
+        # Only probe the setup IPs when the host's addressing changes (joining or
+        # leaving a Wemo.Mini network), plus a slow safety re-check every minute.
         target_ips = ["10.22.22.1", "192.168.49.1"]
         target_ports = [49153, 49152, 49154] 
+        watcher = NetworkWatcher()
+        pending = True
+        followups = 0
+        last_check = 0
         while self.monitoring:
             if self.manual_override_active: 
                 time.sleep(3)
                 continue
-            found_dev = None
-            found_ip = None
-            found_port = None
-            for ip in target_ips:
-                for port in target_ports:
-                    try:
-                        check_url = f"http://{ip}:{port}/setup.xml"
-                        found_dev = pywemo.discovery.device_from_description(check_url)
-                        if found_dev:
-                            found_ip = ip
-                            found_port = port
-                            break
-                    except: pass
-                if found_dev: break
-            if found_dev: 
-                self.current_setup_ip = found_ip
-                self.current_setup_port = found_port
-                self.after(0, lambda: self.set_status_connected(found_dev, found_ip, found_port))
-            else: 
-                self.current_setup_ip = None
-                self.after(0, self.set_status_disconnected)
-            time.sleep(3)
+            if pending or followups or time.time() - last_check > 60:
+                # The device web server can come up a few seconds after DHCP, so re-check briefly
+                if pending: followups = 3
+                pending = False
+                last_check = time.time()
+                found_dev, found_ip, found_port = NetworkUtils.probe_setup_network(target_ips, target_ports)
+                if found_dev: 
+                    followups = 0
+                    self.current_setup_ip = found_ip
+                    self.current_setup_port = found_port
+                    self.after(0, lambda d=found_dev, i=found_ip, p=found_port: self.set_status_connected(d, i, p))
+                else: 
+                    followups = max(0, followups - 1)
+                    self.current_setup_ip = None
+                    self.after(0, self.set_status_disconnected)
+            if watcher.wait_for_change(3 if followups else 10): pending = True
 
     def set_status_connected(self, dev, ip, port):
         self.status_frame.configure(fg_color=("#d0f0c0", "#1a331a"), border_color="#28a745")
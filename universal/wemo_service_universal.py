@@ -9,6 +9,7 @@ import threading
 import logging
 from PIL import Image
 import pystray
+from wemo_files import write_json_atomic, load_json, ConfigWatcher
 
 # --- CONFIGURATION ---
 VERSION = "v4.1.0 (Tray Service)"
@@ -87,6 +88,7 @@ class WemoService:
         self.known_devices = {}
         self.solar = SolarEngine()
         self.running = True
+        self.watcher = ConfigWatcher(APP_DATA_DIR, [os.path.basename(SCHEDULE_FILE), os.path.basename(SETTINGS_FILE)])
         logging.info(f"--- Wemo Service {VERSION} Started ---")
 
     def discover_devices(self):
@@ -96,16 +98,11 @@ class WemoService:
         except: pass
 
     def load_schedules(self):
-        if os.path.exists(SCHEDULE_FILE):
-            try:
-                with open(SCHEDULE_FILE, 'r') as f: return json.load(f)
-            except: pass
-        return []
+        return load_json(SCHEDULE_FILE, list)
 
     def save_schedules(self, data):
-        try:
-            with open(SCHEDULE_FILE, 'w') as f: json.dump(data, f)
-        except: pass
+        try: write_json_atomic(SCHEDULE_FILE, data)
+        except Exception as e: logging.error(f"Failed to save schedules: {e}")
 
     def execute_job(self, job):
         dev_name = job['device']
@@ -124,6 +121,7 @@ class WemoService:
         # Initial Discovery
         self.discover_devices()
         last_discovery = time.time()
+        schedules = self.load_schedules()
         
         while self.running:
             try:
@@ -131,9 +129,8 @@ class WemoService:
                     self.discover_devices()
                     last_discovery = time.time()
 
-                schedules = self.load_schedules()
                 if not schedules:
-                    time.sleep(30); continue
+                    schedules = self.wait_for_config(schedules, 30); continue
 
                 now = datetime.datetime.now()
                 today_str = now.strftime("%Y-%m-%d")
@@ -164,10 +161,20 @@ class WemoService:
 
             except Exception as e: logging.error(f"Loop Error: {e}")
             
-            # Check stop flag frequently
-            for _ in range(30):
-                if not self.running: break
-                time.sleep(1)
+            schedules = self.wait_for_config(schedules, 30)
+
+    def wait_for_config(self, schedules, timeout):
+        """Sleeps up to timeout seconds (checking the stop flag), returning early with fresh
+        schedules when schedules.json or settings.json change on disk."""
+        deadline = time.time() + timeout
+        while self.running and time.time() < deadline:
+            changed = self.watcher.wait_for_change(min(1, deadline - time.time()))
+            if os.path.basename(SETTINGS_FILE) in changed:
+                self.solar = SolarEngine()
+            if os.path.basename(SCHEDULE_FILE) in changed:
+                logging.info("Schedules changed on disk, reloading")
+                return self.load_schedules()
+        return schedules
 
     def stop(self):
         self.running = False
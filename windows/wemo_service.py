@@ -1,11 +1,11 @@
 import pywemo
 import time
-import json
 import os
 import datetime
 import requests
 import sys
 import ctypes # For Single Instance Lock
+from wemo_files import write_json_atomic, load_json
 
 # --- CONFIGURATION ---
 VERSION = "v4.0-Service"
@@ -38,18 +38,8 @@ def is_already_running():
     return False
 
 # --- UTILS ---
-def load_json(path, default_type=dict):
-    if os.path.exists(path):
-        try:
-            with open(path) as f:
-                data = json.load(f)
-                if isinstance(data, default_type): return data
-        except: pass
-    return default_type()
-
 def save_json(path, data):
-    try:
-        with open(path, 'w') as f: json.dump(data, f)
+    try: write_json_atomic(path, data)
     except: pass
 
 class SolarEngine:
@@ -110,6 +100,7 @@ def run_service():
     while True:
         try:
             schedules = load_json(SCHEDULE_FILE, list)
+            schedule_updated = False
             
             now = datetime.datetime.now()
             today_str = now.strftime("%Y-%m-%d")
@@ -148,8 +139,9 @@ def run_service():
                             elif job['action'] == "Toggle": dev.toggle()
                             
                             job['last_run'] = today_str
-                            save_json(SCHEDULE_FILE, schedules)
+                            schedule_updated = True
                         except: pass
+            if schedule_updated: save_json(SCHEDULE_FILE, schedules)
         except: pass
         
         time.sleep(30)